@@ -0,0 +1,106 @@
+# Micro-benchmark of the pixmap -> Tk photo conversion, per zoom level.
+#
+#   python benchmarks/bench_photo.py [--pdf FILE] [--zooms 1,2,3,4,5] [--repeat 20] [--json out.json]
+#
+# Compares pdf_whiteout's conversion (Image.frombuffer over the pixmap's
+# samples) with the former PPM -> BytesIO -> Image.open path, both as far as
+# the Pillow image and through to the Tk photo. Creating Tk photos needs a display
+# (use xvfb-run on headless machines); without one only the Pillow image
+# construction is measured. Peak allocation is what tracemalloc sees, i.e.
+# Python-level buffers such as the PPM bytes, not Tk's own pixel storage.
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageTk
+import tkinter as tk
+
+import pdf_whiteout
+
+
+def _legacy_image(pix):
+    img = Image.open(io.BytesIO(pix.tobytes("ppm")))
+    img.load()  # Image.open is lazy; ImageTk would decode it anyway
+    return img
+
+
+def _sample_page():
+    doc = fitz.open()
+    page = doc.new_page()
+    for i in range(45):
+        page.insert_text((40, 40 + i * 16), "Statement line %d  Account 1234-5678  $%d.00" % (i, i * 37), fontsize=10)
+    for i in range(20):
+        page.draw_rect(fitz.Rect(300 + i * 10, 100 + i * 20, 400 + i * 5, 140 + i * 20),
+                       color=(0, 0, 0.5), fill=(0.8, 0.9, 1.0))
+    return doc, page
+
+
+def measure(convert, pix, repeat):
+    convert(pix)  # Warm up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = convert(pix)
+        times.append(time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    result = convert(pix)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"median_ms": round(statistics.median(times) * 1000, 3),
+            "min_ms": round(min(times) * 1000, 3),
+            "peak_alloc_bytes": peak}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pixmap to Tk photo conversion")
+    parser.add_argument("--pdf", help="PDF whose first page is rendered (default: a generated page)")
+    parser.add_argument("--zooms", default="1,2,3,4,5", help="Comma separated zoom factors")
+    parser.add_argument("--repeat", type=int, default=20, help="Conversions timed per backend and zoom")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.pdf:
+        doc = fitz.open(args.pdf)
+        page = doc[0]
+    else:
+        doc, page = _sample_page()
+
+    converters = {"legacy-ppm/image": _legacy_image, "pillow/image": pdf_whiteout._pixmap_to_image}
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError as e:
+        print("No display (%s); measuring Pillow image construction only" % e, file=sys.stderr)
+    else:
+        converters["legacy-ppm"] = lambda pix: ImageTk.PhotoImage(_legacy_image(pix))
+        converters["pillow"] = lambda pix: ImageTk.PhotoImage(pdf_whiteout._pixmap_to_image(pix))
+
+    results = []
+    for zoom in (float(z) for z in args.zooms.split(",")):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        for name, convert in converters.items():
+            row = {"zoom": zoom, "backend": name, "width": pix.width, "height": pix.height}
+            row.update(measure(convert, pix, args.repeat))
+            results.append(row)
+            print("zoom %.2f %5dx%-5d %-18s median %8.2f ms  min %8.2f ms  peak alloc %s" % (
+                zoom, pix.width, pix.height, name, row["median_ms"], row["min_ms"],
+                pdf_whiteout._format_size(row["peak_alloc_bytes"])))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"pymupdf": fitz.VersionBind, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
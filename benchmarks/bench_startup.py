@@ -0,0 +1,134 @@
+# Cold start of pdf_whiteout, measured in fresh interpreters, as a guard
+# against slow imports creeping back in.
+#
+#   python benchmarks/bench_startup.py                       # print the numbers
+#   python benchmarks/bench_startup.py -o startup.json
+#   python benchmarks/bench_startup.py --compare startup.json
+#
+# Reports the interpreter's own start-up, the import of pdf_whiteout as seen
+# by -X importtime, the slowest modules it pulls in, and (when a display is
+# available) the time until the window is built. Fails when a module that
+# should only be imported on first use (PyMuPDF, Pillow, Tk, multiprocessing)
+# is imported at start-up, when the import exceeds --max-ms, or when a
+# measurement got more than 10% worse than the --compare baseline.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+
+import bench_suite
+
+# Imported on first use only; seeing one of these at start-up is a regression
+DEFERRED = ("fitz", "pymupdf", "PIL", "tkinter", "multiprocessing")
+
+WINDOW = """
+import time
+start = time.perf_counter()
+import pdf_whiteout
+root = pdf_whiteout.tk.Tk()
+app = pdf_whiteout.PDFEditorApp(root)
+root.update()
+print(time.perf_counter() - start)
+root.destroy()
+"""
+
+
+def _run(args):
+    # Wall time of a fresh interpreter running args, and its completed process
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, process
+
+
+def parse_importtime(output):
+    # {module: (self us, cumulative us)} from the stderr of -X importtime
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+
+def measure(repeat):
+    interpreter, imported, window = [], [], []
+    modules = {}
+    for _ in range(repeat):
+        seconds, _ = _run(["-c", "pass"])
+        interpreter.append(seconds)
+        _, process = _run(["-X", "importtime", "-c", "import pdf_whiteout"])
+        if process.returncode:
+            raise RuntimeError("import pdf_whiteout failed:\n" + process.stderr)
+        modules = parse_importtime(process.stderr)
+        imported.append(modules["pdf_whiteout"][1] / 1e6)
+        _, process = _run(["-c", WINDOW])
+        if process.returncode == 0:
+            window.append(float(process.stdout.split()[-1]))
+
+    row = {
+        "interpreter_ms": round(statistics.median(interpreter) * 1000, 3),
+        "import_ms": round(statistics.median(imported) * 1000, 3),
+        "modules": len(modules),
+    }
+    if window:
+        row["window_ms"] = round(statistics.median(window) * 1000, 3)
+    return row, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold start of pdf_whiteout")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement (default: 5)")
+    parser.add_argument("--max-ms", type=float, default=150.0,
+                        help="Fail when importing pdf_whiteout takes longer (default: 150)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imported modules to list (default: 10)")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    row, modules = measure(args.repeat)
+    print("  ".join("%s=%s" % item for item in row.items()))
+    if "window_ms" not in row:
+        print("window: not measured (no display)")
+    print("Slowest imports (cumulative ms):")
+    for name, (_, cumulative) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print("    %-40s %8.2f" % (name, cumulative / 1000))
+
+    failures = 0
+    deferred = sorted({name.split(".")[0] for name in modules} & set(DEFERRED))
+    if deferred:
+        print("FAIL imported at start-up, should be deferred: %s" % ", ".join(deferred), file=sys.stderr)
+        failures += 1
+    if row["import_ms"] > args.max_ms:
+        print("FAIL import took %.1f ms, budget %.1f ms" % (row["import_ms"], args.max_ms), file=sys.stderr)
+        failures += 1
+
+    report = {
+        "meta": {
+            "commit": bench_suite._git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat,
+        },
+        # Shaped like bench_suite's results, so its comparison applies
+        "sections": {"startup": {"peak_rss_bytes": None, "results": [row]}},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("Compared with %s (commit %s):" % (args.compare, baseline["meta"].get("commit")))
+        failures += bench_suite.compare(baseline, report)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+# Headless performance benchmarks of the editor's hot paths, on synthetic
+# corpora (see corpus.py). Every section runs in its own process, so its
+# peak RSS is reported on its own.
+#
+#   python benchmarks/bench_suite.py -o results.json            # full run
+#   python benchmarks/bench_suite.py --quick -o quick.json      # smaller sizes
+#   python benchmarks/bench_suite.py --compare base.json -o new.json
+#
+# Sections:
+#   render     page render + conversion latency per zoom step, per corpus kind
+#   apply_save journal write, and save time per save mode, against annotation count
+#   hit_test   click hit-test latency against annotation count
+#   scaling    open, first page and page layout time against page count
+#
+# The sections use the GUI-free code of pdf_whiteout (the same functions the
+# window calls), so no display is needed. The corpora are generated before
+# any section starts, so generating them never counts towards a section.
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import fitz  # PyMuPDF
+
+import corpus
+import pdf_whiteout
+
+VIEWPORT = (1280, 800)  # Canvas size the render section assumes
+
+FULL = {
+    "zooms": [1.0 + 0.25 * i for i in range(17)],
+    "annotations": [10, 100, 1000, 10000],
+    "page_counts": [1, 10, 100, 1000, 5000],
+    "repeat": 5,
+}
+QUICK = {
+    "zooms": [1.0, 2.0, 3.0, 4.0, 5.0],
+    "annotations": [10, 100, 1000],
+    "page_counts": [1, 10, 100],
+    "repeat": 3,
+}
+
+
+def _timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3)
+
+
+def _peak_rss():
+    # Peak resident set size of this process in bytes, where the platform reports it
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def bench_render(config, corpus_dir):
+    # What the window does per zoom step: a full-page bitmap, or the tiles
+    # covering the viewport once the page is too big, then the conversion.
+    # Tiled rows also time a full-page render at the same zoom, as the first
+    # paint of a tiled page should never be slower than that (scans are the
+    # case to watch: every clip decodes the page image).
+    cache = pdf_whiteout.PixmapCache()
+    results = []
+    for kind in corpus.KINDS:
+        doc = fitz.open(corpus.corpus_path(corpus_dir, kind, 3))
+        page = doc[1]
+        for zoom in config["zooms"]:
+            width = math.ceil(page.rect.width * zoom)
+            height = math.ceil(page.rect.height * zoom)
+            tiled = width * height > pdf_whiteout.TILE_MIN_PIXELS
+            matrix = fitz.Matrix(zoom, zoom)
+            if tiled:
+                # The tiles covering the viewport at the top-left of the page
+                size = pdf_whiteout.TILE_SIZE
+                tiles = [(col, row)
+                         for col in range((min(width, VIEWPORT[0]) - 1) // size + 1)
+                         for row in range((min(height, VIEWPORT[1]) - 1) // size + 1)]
+
+                def render():
+                    return list(pdf_whiteout.render_tiles(page, zoom, tiles).values())
+            else:
+                def render():
+                    return [page.get_pixmap(matrix=matrix)]
+
+            pixmaps = render()
+            for i, pix in enumerate(pixmaps):
+                cache.put((kind, zoom, i), pix)
+            row = {
+                "kind": kind, "zoom": zoom, "tiled": tiled, "bitmaps": len(pixmaps),
+                "pixels": sum(pix.width * pix.height for pix in pixmaps),
+                "render_ms": _timed(render, config["repeat"]),
+                "convert_ms": _timed(lambda: [pdf_whiteout._pixmap_to_image(pix) for pix in pixmaps],
+                                     config["repeat"]),
+                "cache_hit_ms": _timed(lambda: [cache.get((kind, zoom, i)) for i in range(len(pixmaps))],
+                                       config["repeat"]),
+            }
+            if tiled:
+                row["full_page_ms"] = _timed(lambda: page.get_pixmap(matrix=matrix), config["repeat"])
+            results.append(row)
+        doc.close()
+    return results
+
+
+def bench_apply_save(config, corpus_dir):
+    # Applying n selections (and n / 10 texts) spread over 10 pages through
+    # the journal, and saving them in every save mode the way the window
+    # does: a SaveJob, child process included, from start to done. The
+    # incremental saves rewrite a fresh copy of the corpus file each time.
+    source = corpus.corpus_path(corpus_dir, "text", 10)
+    folder = tempfile.mkdtemp(prefix="bench-save-")
+    results = []
+    try:
+        for count in config["annotations"]:
+            rng = random.Random(count)
+            journal = pdf_whiteout.EditJournal()
+            for page_index in range(10):
+                rects = []
+                for _ in range(count // 10):
+                    x, y = rng.uniform(30, 500), rng.uniform(30, 700)
+                    rects.append((x, y, x + rng.uniform(20, 80), y + rng.uniform(8, 14)))
+                texts = tuple((journal.new_key(), rng.uniform(40, 500), rng.uniform(40, 700), "REDACTED", 10.0)
+                              for _ in range(max(1, count // 100)))
+                journal.record(page_index, ("apply", tuple(rects), texts))
+            edits = journal.edits()
+
+            data = fitz.open(source).tobytes()
+            write_ms = []
+            for _ in range(config["repeat"]):
+                copy = fitz.open("pdf", data)
+                start = time.perf_counter()
+                stats = journal.write_to(copy)
+                write_ms.append(time.perf_counter() - start)
+                copy.close()
+            row = {"annotations": count, "fills": stats["fills"], "texts": stats["texts"],
+                   "write_ms": round(statistics.median(write_ms) * 1000, 3)}
+
+            for mode in pdf_whiteout.SAVE_MODES:
+                save_ms = []
+                for _ in range(config["repeat"]):
+                    if mode == "Incremental":
+                        src = dst = os.path.join(folder, "incremental.pdf")
+                        shutil.copyfile(source, dst)
+                    else:
+                        src, dst = source, os.path.join(folder, mode.lower() + ".pdf")
+                    job = pdf_whiteout.SaveJob(src, edits, dst, mode=mode).start()
+                    while not job.done:
+                        time.sleep(0.002)
+                    if job.error:
+                        raise RuntimeError("%s save failed: %s" % (mode, job.error))
+                    if mode == "Incremental":
+                        os.replace(job.part, dst)  # What the window does once the job is done
+                    save_ms.append(job.elapsed)
+                save = statistics.median(save_ms)
+                row["%s_save_ms" % mode.lower()] = round(save * 1000, 3)
+                row["%s_output_bytes" % mode.lower()] = job.size
+                row["%s_annotations_per_s" % mode.lower()] = round(count / save, 1)
+            results.append(row)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def _hit_test_app(count, rng):
+    # An editor without a window, holding count text annotations on a page
+    # drawn at zoom 2. Tk fonts need a display, so the text sizes are put in
+    # its font metrics cache up front.
+    app = object.__new__(pdf_whiteout.PDFEditorApp)
+    app.scale = 2.0
+    app.text_annotations = pdf_whiteout.TextColumns()
+    app.text_index = pdf_whiteout.SpatialGrid()
+    app._text_index_scale = None
+    app._fonts = {}
+    app._text_sizes = {}
+    for item in range(count):
+        text = "Note %d" % item
+        font_size = rng.choice((10, 12, 14))
+        app.text_annotations.append(rng.uniform(0, 612), rng.uniform(0, 792), text, font_size, item + 1)
+        app._text_sizes[(text, app._tk_font(font_size))] = (rng.uniform(30, 200), rng.uniform(12, 40))
+    return app
+
+
+def bench_hit_test(config, corpus_dir):
+    # A click on the page in text mode: PDFEditorApp._text_at, after the
+    # rebuild of its text index that the first click after a zoom pays
+    results = []
+    for count in config["annotations"]:
+        rng = random.Random(count)
+        app = _hit_test_app(count, rng)
+        start = time.perf_counter()
+        app._text_at(0, 0)
+        build = time.perf_counter() - start
+        clicks = [(rng.uniform(0, 1224), rng.uniform(0, 1584)) for _ in range(2000)]
+        start = time.perf_counter()
+        hits = 0
+        for x, y in clicks:
+            if app._text_at(x, y) >= 0:
+                hits += 1
+        elapsed = time.perf_counter() - start
+        results.append({
+            "annotations": count, "index_build_ms": round(build * 1000, 3),
+            "click_us": round(elapsed / len(clicks) * 1e6, 3), "hit_ratio": round(hits / len(clicks), 3),
+        })
+    return results
+
+
+def bench_scaling(config, corpus_dir):
+    # What opening a document costs as it grows: open, first page at the
+    # default zoom, and the layout of the continuous view
+    results = []
+    for pages in config["page_counts"]:
+        path = corpus.corpus_path(corpus_dir, "text", pages)
+        start = time.perf_counter()
+        doc = fitz.open(path)
+        page_count = doc.page_count
+        opened = time.perf_counter() - start
+        doc[0].get_pixmap(matrix=fitz.Matrix(2, 2))
+        first_page = time.perf_counter() - start
+        start = time.perf_counter()
+        pdf_whiteout.PageLayout(doc)
+        layout = time.perf_counter() - start
+        doc.close()
+        results.append({
+            "pages": page_count, "file_bytes": os.path.getsize(path), "open_ms": round(opened * 1000, 3),
+            "first_page_ms": round(first_page * 1000, 3), "layout_ms": round(layout * 1000, 3),
+        })
+    return results
+
+
+SECTIONS = {
+    "render": bench_render,
+    "apply_save": bench_apply_save,
+    "hit_test": bench_hit_test,
+    "scaling": bench_scaling,
+}
+
+
+def _corpora(name, config):
+    # (kind, pages) of the corpus files a section reads
+    if name == "render":
+        return [(kind, 3) for kind in corpus.KINDS]
+    if name == "apply_save":
+        return [("text", 10)]
+    if name == "scaling":
+        return [("text", pages) for pages in config["page_counts"]]
+    return []
+
+
+def _run_section(name, config, corpus_dir):
+    # Runs in a fresh process, so peak RSS belongs to this section alone
+    start = time.perf_counter()
+    results = SECTIONS[name](config, corpus_dir)
+    return {"seconds": round(time.perf_counter() - start, 3), "peak_rss_bytes": _peak_rss(), "results": results}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(report):
+    # {"section/row label/metric": value} of every numeric measurement
+    flat = {}
+    for name, section in report["sections"].items():
+        flat["%s/peak_rss_bytes" % name] = section["peak_rss_bytes"]
+        for row in section["results"]:
+            label = ",".join("%s=%s" % (k, row[k]) for k in ("kind", "zoom", "annotations", "pages") if k in row)
+            for metric, value in row.items():
+                if metric.endswith(("_ms", "_us", "_per_s", "_bytes")):
+                    flat["%s/%s/%s" % (name, label, metric)] = value
+    return flat
+
+
+def compare(baseline, report, threshold=0.10):
+    # Print the measurements that moved by more than threshold; returns how many got worse
+    old, new = _flatten(baseline), _flatten(report)
+    worse = 0
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        if not a or b is None:
+            continue
+        change = (b - a) / a
+        if key.endswith("_per_s"):
+            change = -change  # Higher is better
+        if abs(change) > threshold:
+            worse += change > 0
+            print("%-8s %-60s %12s -> %-12s (%+.0f%%)" % (
+                "worse" if change > 0 else "better", key, a, b, change * 100))
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the performance benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Smaller corpora and fewer zoom steps")
+    parser.add_argument("--sections", default=",".join(SECTIONS),
+                        help="Comma separated subset of: %s" % ", ".join(SECTIONS))
+    parser.add_argument("--corpus-dir", default=os.path.join(HERE, "corpus"),
+                        help="Where generated PDFs are cached (default: benchmarks/corpus)")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    config = QUICK if args.quick else FULL
+    names = [name.strip() for name in args.sections.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SECTIONS]
+    if unknown:
+        parser.error("unknown section(s): %s" % ", ".join(unknown))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "pymupdf": fitz.VersionBind, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "quick": args.quick,
+        },
+        "config": config,
+        "sections": {},
+    }
+    # Generate missing corpora here, so it doesn't show in a section's time or peak RSS
+    for name in names:
+        for kind, pages in _corpora(name, config):
+            corpus.corpus_path(args.corpus_dir, kind, pages)
+
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            section = executor.submit(_run_section, name, config, args.corpus_dir).result()
+        report["sections"][name] = section
+        print("%-10s %7.2fs  peak RSS %s" % (name, section["seconds"], pdf_whiteout._format_size(
+            section["peak_rss_bytes"]) if section["peak_rss_bytes"] else "n/a"))
+        for row in section["results"]:
+            print("    " + "  ".join("%s=%s" % item for item in row.items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("Compared with %s (commit %s):" % (args.compare, baseline["meta"].get("commit")))
+        if compare(baseline, report):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
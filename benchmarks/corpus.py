@@ -0,0 +1,91 @@
+# Deterministic synthetic PDFs for the benchmarks.
+#
+#   text   - dense lines of running text, like statements and reports
+#   vector - a few hundred filled and stroked paths per page, like drawings
+#   scan   - one full-page JPEG per page, like a scanned archive
+#
+# The same (kind, pages, seed) always produces the same content, so numbers
+# from different commits are comparable. Files are cached in a directory and
+# only generated when missing.
+import io
+import os
+import random
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+KINDS = ("text", "vector", "scan")
+
+_WORDS = ("account", "balance", "payment", "invoice", "transfer", "reference", "customer", "statement",
+          "period", "amount", "total", "credit", "debit", "interest", "charge", "date", "number", "branch")
+
+
+def _text_page(page, rng, font):
+    writer = fitz.TextWriter(page.rect)
+    y = 40
+    while y < page.rect.height - 40:
+        line = " ".join(rng.choice(_WORDS) for _ in range(10))
+        writer.append((40, y), "%s %d.%02d" % (line, rng.randrange(10000), rng.randrange(100)),
+                      font=font, fontsize=9)
+        y += 12
+    writer.write_text(page)
+
+
+def _vector_page(page, rng):
+    shape = page.new_shape()
+    width, height = page.rect.width, page.rect.height
+    for _ in range(300):
+        x, y = rng.uniform(0, width - 60), rng.uniform(0, height - 60)
+        kind = rng.randrange(3)
+        if kind == 0:
+            shape.draw_rect(fitz.Rect(x, y, x + rng.uniform(5, 60), y + rng.uniform(5, 60)))
+        elif kind == 1:
+            shape.draw_line((x, y), (x + rng.uniform(-60, 60), y + rng.uniform(-60, 60)))
+        else:
+            shape.draw_bezier((x, y), (x + 20, y - 30), (x + 40, y + 30), (x + 60, y))
+        color = (rng.random(), rng.random(), rng.random())
+        shape.finish(color=color, fill=color if kind == 0 else None, width=rng.uniform(0.3, 2))
+    shape.commit()
+
+
+def _scan_image(rng):
+    # A 150 dpi letter-size light grey page with noise, so JPEG can't compress it away
+    size = (1275, 1650)
+    img = Image.frombytes("L", size, rng.randbytes(size[0] * size[1])).point(lambda v: 160 + v // 4)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=75)
+    return buf.getvalue()
+
+
+def generate(path, kind, pages, seed=1):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    font = fitz.Font("helv")
+    image_xref = 0
+    for _ in range(pages):
+        page = doc.new_page()  # Letter size
+        if kind == "text":
+            _text_page(page, rng, font)
+        elif kind == "vector":
+            _vector_page(page, rng)
+        elif kind == "scan":
+            # Every page shows the same image object, so big corpora stay small on disk
+            if image_xref:
+                page.insert_image(page.rect, xref=image_xref)
+            else:
+                image_xref = page.insert_image(page.rect, stream=_scan_image(rng))
+        else:
+            raise ValueError("Unknown corpus kind: %r" % kind)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+    return path
+
+
+def corpus_path(directory, kind, pages, seed=1):
+    # Path of the (kind, pages, seed) corpus file, generating it if needed
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "%s-%d-s%d.pdf" % (kind, pages, seed))
+    if not os.path.exists(path):
+        generate(path + ".part", kind, pages, seed)
+        os.replace(path + ".part", path)
+    return path
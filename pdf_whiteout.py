@@ -1,8 +1,1428 @@
-import fitz  # PyMuPDF
-import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog, ttk
-from PIL import Image, ImageTk
-import io
+import argparse
+import bisect
+import concurrent.futures  # ProcessPoolExecutor, and with it multiprocessing, is imported on first use
+import functools
+import hashlib
+import importlib
+import json
+import math
+import mmap
+import os
+import queue
+import re
+import shutil
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class _LazyModule:
+    # Stands in for a module that is slow to import and only imported when one
+    # of its attributes is first used. PyMuPDF alone takes longer to import
+    # than the window takes to appear, and is not needed until a PDF is opened;
+    # the command line modes and worker processes never need Tk.
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        # Only called for attributes not copied in yet, i.e. until the first import
+        return getattr(self._lazy_load(), attr)
+
+    def _lazy_load(self):
+        module = importlib.import_module(self._lazy_name)
+        # Later lookups find the module's attributes directly on the proxy
+        for name, value in module.__dict__.items():
+            self.__dict__.setdefault(name, value)
+        return module
+
+
+fitz = _LazyModule("fitz")  # PyMuPDF
+Image = _LazyModule("PIL.Image")
+ImageTk = _LazyModule("PIL.ImageTk")
+tk = _LazyModule("tkinter")
+filedialog = _LazyModule("tkinter.filedialog")
+messagebox = _LazyModule("tkinter.messagebox")
+simpledialog = _LazyModule("tkinter.simpledialog")
+ttk = _LazyModule("tkinter.ttk")
+tkfont = _LazyModule("tkinter.font")
+multiprocessing = _LazyModule("multiprocessing")
+
+
+def _preload_modules():
+    # Import what opening the first PDF needs on a background thread, once
+    # the window is up, so that the first load_pdf does not wait for it
+    def load():
+        for module in (fitz, Image, ImageTk):
+            module._lazy_load()
+    threading.Thread(target=load, name="preload", daemon=True).start()
+
+
+_profiler = None  # Active Profiler, or None while profiling is off
+
+
+class Profiler:
+    # Records the durations of profiled calls and running counters (cache
+    # hits and misses, bytes rasterized), exportable as Chrome trace-event
+    # JSON for chrome://tracing or Perfetto. Old events are dropped once
+    # max_events is reached, so a long session can't grow without bound.
+    def __init__(self, max_events=200000):
+        self.events = deque(maxlen=max_events)  # (name, category, start, end, thread id) or counter samples
+        self.counters = {}
+        self.last = {}  # name -> duration of the latest call in seconds
+        self._origin = time.perf_counter()
+
+    def complete(self, name, category, start, end, thread=None):
+        self.events.append(("X", name, category, start, end, thread or threading.get_ident()))
+        self.last[name] = end - start
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def sample(self, name, values):
+        self.events.append(("C", name, "counters", time.perf_counter(), dict(values), None))
+
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        trace = []
+        for kind, name, category, start, end, thread in self.events:
+            event = {"name": name, "cat": category, "ph": kind, "pid": pid,
+                     "ts": round((start - self._origin) * 1e6, 1)}
+            if kind == "X":
+                event["dur"] = round((end - start) * 1e6, 1)
+                event["tid"] = thread
+            else:
+                event["tid"] = 0
+                event["args"] = end
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms",
+                "otherData": {"counters": dict(self.counters)}}
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+def enable_profiling():
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def profiled(category):
+    # Record every call of the decorated function as a trace event while
+    # profiling is on. While it is off the only cost is one global lookup.
+    def decorate(fn):
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.complete(name, category, start, time.perf_counter())
+        return wrapper
+    return decorate
+
+
+def merge_rects(rects, tolerance=0.01):
+    # Reduce (x0, y0, x1, y1) rectangles to a smaller set painting exactly the
+    # same area: drop rectangles covered by another one and merge pairs whose
+    # union is itself a rectangle (same span on one axis, overlapping or
+    # touching on the other).
+    rects = sorted({tuple(r) for r in rects if r[0] < r[2] and r[1] < r[3]},
+                   key=lambda r: (r[2] - r[0]) * (r[3] - r[1]), reverse=True)
+
+    # Drop contained rectangles, largest first, using the grid for candidates
+    kept = []
+    grid = SpatialGrid(cell_size=64)
+    for x0, y0, x1, y1 in rects:
+        covered = False
+        for i in grid.query_rect(x0, y0, x1, y1):
+            kx0, ky0, kx1, ky1 = kept[i]
+            if kx0 <= x0 + tolerance and ky0 <= y0 + tolerance and kx1 >= x1 - tolerance and ky1 >= y1 - tolerance:
+                covered = True
+                break
+        if not covered:
+            grid.insert(len(kept), (x0, y0, x1, y1))
+            kept.append((x0, y0, x1, y1))
+
+    # Merge along rows (same y span) and columns (same x span) until stable
+    def merge_along(rects, axis):
+        lo, hi = (0, 2) if axis == 0 else (1, 3)
+        span_lo, span_hi = (1, 3) if axis == 0 else (0, 2)
+        rects = sorted(rects, key=lambda r: (round(r[span_lo] / tolerance), round(r[span_hi] / tolerance), r[lo]))
+        merged = []
+        for r in rects:
+            if merged:
+                last = merged[-1]
+                if (abs(last[span_lo] - r[span_lo]) <= tolerance and abs(last[span_hi] - r[span_hi]) <= tolerance
+                        and r[lo] <= last[hi] + tolerance):
+                    grown = list(last)
+                    grown[hi] = max(last[hi], r[hi])
+                    merged[-1] = tuple(grown)
+                    continue
+            merged.append(r)
+        return merged
+
+    while True:
+        count = len(kept)
+        kept = merge_along(merge_along(kept, 0), 1)
+        if len(kept) == count:
+            return kept
+
+
+def apply_page_edits(page, erasures, texts, measure=False):
+    # Write whiteout rectangles and text onto a page. Coordinates are in PDF
+    # points: erasures are (x0, y0, x1, y1), texts are (x, y, text, font_size).
+    # This is shared by the editor and the headless batch mode.
+    #
+    # Fills and text go out together as one Shape commit, so a page gets a
+    # single content-stream fragment per apply no matter how many edits there
+    # are. Text uses the base-14 Helvetica, which is referenced rather than
+    # embedded. Returns statistics about the write; with measure=True it also
+    # estimates the bytes the former one-call-per-edit approach would have
+    # written.
+    erasures = list(erasures)
+    texts = list(texts)
+    stats = {"rects": len(erasures), "fills": 0, "texts": len(texts), "bytes_written": 0}
+    before = len(page.read_contents()) if measure else 0
+
+    fills = merge_rects(erasures)
+    if fills or texts:
+        shape = page.new_shape()
+        for rect in fills:
+            shape.draw_rect(fitz.Rect(rect))
+        if fills:
+            shape.finish(color=(1, 1, 1), fill=(1, 1, 1))
+        for x, y, text, font_size in texts:
+            shape.insert_text((x, y), text, fontname="helv", fontsize=font_size, color=(0, 0, 0))
+        shape.commit(overlay=True)
+    stats["fills"] = len(fills)
+
+    if measure:
+        stats["bytes_written"] = len(page.read_contents()) - before
+        stats["bytes_saved"] = max(0, _estimate_unbatched_bytes(page.rect, erasures, texts) - stats["bytes_written"])
+    return stats
+
+
+def _estimate_unbatched_bytes(page_rect, erasures, texts, sample=50):
+    # Content-stream growth of one draw_rect/insert_text call per edit,
+    # extrapolated from a sample written to a scratch page
+    scratch = fitz.open()
+    try:
+        page = scratch.new_page(width=page_rect.width, height=page_rect.height)
+        size = 0
+        for items, write in ((erasures, lambda r: page.draw_rect(fitz.Rect(r), color=(1, 1, 1),
+                                                                 fill=(1, 1, 1), overlay=True)),
+                             (texts, lambda t: page.insert_text((t[0], t[1]), t[2], fontsize=t[3]))):
+            if not items:
+                continue
+            start = len(page.read_contents())
+            for item in items[:sample]:
+                write(item)
+            size += (len(page.read_contents()) - start) * len(items) // min(len(items), sample)
+        return size
+    finally:
+        scratch.close()
+
+
+class RectColumns:
+    # Rectangles stored as four array('d') columns of PDF points. Rows are
+    # normalized so that x0 <= x1 and y0 <= y1.
+    def __init__(self):
+        self.x0 = array("d")
+        self.y0 = array("d")
+        self.x1 = array("d")
+        self.y1 = array("d")
+
+    def __len__(self):
+        return len(self.x0)
+
+    def __getitem__(self, index):
+        return (self.x0[index], self.y0[index], self.x1[index], self.y1[index])
+
+    def __iter__(self):
+        return zip(self.x0, self.y0, self.x1, self.y1)
+
+    def append(self, x0, y0, x1, y1):
+        self.x0.append(min(x0, x1))
+        self.y0.append(min(y0, y1))
+        self.x1.append(max(x0, x1))
+        self.y1.append(max(y0, y1))
+
+    def pop(self, index=-1):
+        return (self.x0.pop(index), self.y0.pop(index), self.x1.pop(index), self.y1.pop(index))
+
+    def clear(self):
+        for column in (self.x0, self.y0, self.x1, self.y1):
+            del column[:]
+
+    def clip(self, x0, y0, x1, y1):
+        # Clamp every rectangle to the given box and drop the ones left empty
+        rows = [(max(a, x0), max(b, y0), min(c, x1), min(d, y1)) for a, b, c, d in self]
+        rows = [r for r in rows if r[0] < r[2] and r[1] < r[3]]
+        self.x0, self.y0, self.x1, self.y1 = (array("d", column) for column in zip(*rows)) if rows else \
+            (array("d"), array("d"), array("d"), array("d"))
+
+    def scaled(self, factor):
+        # Rows converted from PDF points to screen pixels at the given zoom
+        return [(a * factor, b * factor, c * factor, d * factor) for a, b, c, d in self]
+
+
+class TextColumns:
+    # Text annotations as array('d') columns of PDF points (the insert_text
+    # anchor) plus the strings. items holds the canvas text item of each row
+    # while the annotation is on screen, and rows maps such an item back to
+    # its row for hit-testing.
+    def __init__(self):
+        self.x = array("d")
+        self.y = array("d")
+        self.font_size = array("d")
+        self.text = []
+        self.items = []
+        self.rows = {}  # canvas item id -> row index
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        return (self.x[index], self.y[index], self.text[index], self.font_size[index])
+
+    def __iter__(self):
+        return zip(self.x, self.y, self.text, self.font_size)
+
+    def append(self, x, y, text, font_size, item=None):
+        self.x.append(x)
+        self.y.append(y)
+        self.text.append(text)
+        self.font_size.append(font_size)
+        self.items.append(item)
+        if item is not None:
+            self.rows[item] = len(self.items) - 1
+
+    def set_item(self, index, item):
+        self.rows.pop(self.items[index], None)
+        self.items[index] = item
+        if item is not None:
+            self.rows[item] = index
+
+    def move(self, index, x, y):
+        self.x[index] = x
+        self.y[index] = y
+
+    def resize(self, index, font_size):
+        self.font_size[index] = font_size
+
+    def pop(self, index=-1):
+        row = (self.x.pop(index), self.y.pop(index), self.text.pop(index), self.font_size.pop(index))
+        item = self.items.pop(index)
+        self.rows.pop(item, None)
+        # The rows after it moved up by one
+        for i in range(index if index >= 0 else len(self.items) + index + 1, len(self.items)):
+            if self.items[i] is not None:
+                self.rows[self.items[i]] = i
+        return row, item
+
+    def clear(self):
+        for column in (self.x, self.y, self.font_size, self.text, self.items):
+            del column[:]
+        self.rows.clear()
+
+    def clip(self, x0, y0, x1, y1):
+        # Keep every anchor point inside the given box
+        self.x = array("d", [min(max(v, x0), x1) for v in self.x])
+        self.y = array("d", [min(max(v, y0), y1) for v in self.y])
+
+
+class EditStore:
+    # Pending edits of one page in PDF points. Zoom is only a view transform
+    # (screen = pdf * scale), so nothing here changes when the user zooms.
+    def __init__(self):
+        self.erasures = RectColumns()
+        self.texts = TextColumns()
+
+    def __bool__(self):
+        return bool(len(self.erasures) or len(self.texts))
+
+    def clear(self):
+        self.erasures.clear()
+        self.texts.clear()
+
+    def clip(self, rect):
+        self.erasures.clip(rect.x0, rect.y0, rect.x1, rect.y1)
+        self.texts.clip(rect.x0, rect.y0, rect.x1, rect.y1)
+
+
+class EditJournal:
+    # Per-page journal of applied edits. The on-screen preview is composited
+    # from the journal and nothing is written into the document until it is
+    # saved, so undo and redo only move a page's pointer. Operations, all in
+    # PDF points:
+    #   ("apply", rects, texts)  rects are (x0, y0, x1, y1),
+    #                            texts are (key, x, y, text, font_size)
+    #   ("move", key, x, y)
+    #   ("resize", key, font_size)
+    #   ("remove", key)
+    def __init__(self):
+        self._ops = {}  # page_index -> list of operations
+        self._pointer = {}  # page_index -> number of active operations
+        self._states = {}  # page_index -> (pointer, replayed state)
+        self._floor = {}  # page_index -> operations held by a running incremental save
+        self._next_key = 0
+        self.version = 0  # Bumped on every change
+
+    def new_key(self):
+        self._next_key += 1
+        return self._next_key
+
+    def record(self, page_index, op):
+        # A new operation discards whatever could have been redone
+        ops = self._ops.setdefault(page_index, [])
+        del ops[self._pointer.get(page_index, 0):]
+        ops.append(op)
+        self._pointer[page_index] = len(ops)
+        self._states.pop(page_index, None)
+        self.version += 1
+
+    def can_undo(self, page_index):
+        return self._pointer.get(page_index, 0) > self._floor.get(page_index, 0)
+
+    def can_redo(self, page_index):
+        return self._pointer.get(page_index, 0) < len(self._ops.get(page_index, ()))
+
+    def undo(self, page_index):
+        if not self.can_undo(page_index):
+            return False
+        self._pointer[page_index] -= 1
+        self.version += 1
+        return True
+
+    def redo(self, page_index):
+        if not self.can_redo(page_index):
+            return False
+        self._pointer[page_index] += 1
+        self.version += 1
+        return True
+
+    def pages(self):
+        # Pages with at least one active operation
+        return sorted(i for i, pointer in self._pointer.items() if pointer)
+
+    def clear(self):
+        self._ops.clear()
+        self._pointer.clear()
+        self._states.clear()
+        self._floor.clear()
+        self.version += 1
+
+    def hold(self):
+        # Pin the active operations of every page while an incremental save
+        # writes them into the file: they can't be undone, later operations
+        # can. Returns {page_index: operations held} for release().
+        held = {page_index: self._pointer[page_index] for page_index in self.pages()}
+        self._floor.update(held)
+        self.version += 1
+        return held
+
+    def release(self, held, written):
+        # End a hold. Once written, the held operations are part of the file
+        # and are dropped; text they applied can no longer be moved.
+        for page_index, count in held.items():
+            self._floor.pop(page_index, None)
+            if written and page_index in self._ops:
+                del self._ops[page_index][:count]
+                self._pointer[page_index] -= count
+                self._states.pop(page_index, None)
+        self.version += 1
+
+    def state(self, page_index):
+        # Replay the active operations of a page into (rects, texts), texts
+        # mapping key -> (x, y, text, font_size). The result is memoized and
+        # must not be modified by the caller.
+        pointer = self._pointer.get(page_index, 0)
+        memo = self._states.get(page_index)
+        if memo is not None and memo[0] == pointer:
+            return memo[1]
+
+        rects = []
+        texts = {}
+        for op in self._ops.get(page_index, ())[:pointer]:
+            kind = op[0]
+            if kind == "apply":
+                rects.extend(op[1])
+                for key, x, y, text, font_size in op[2]:
+                    texts[key] = (x, y, text, font_size)
+            elif kind == "move" and op[1] in texts:
+                _, _, text, font_size = texts[op[1]]
+                texts[op[1]] = (op[2], op[3], text, font_size)
+            elif kind == "resize" and op[1] in texts:
+                x, y, text, _ = texts[op[1]]
+                texts[op[1]] = (x, y, text, op[2])
+            elif kind == "remove":
+                texts.pop(op[1], None)
+
+        self._states[page_index] = (pointer, (rects, texts))
+        return rects, texts
+
+    def edits(self):
+        # {page_index: (rects, texts)} of every page with edits, texts as
+        # (x, y, text, font_size) rows; plain data that pickles to a worker
+        edits = {}
+        for page_index in self.pages():
+            rects, texts = self.state(page_index)
+            if rects or texts:
+                edits[page_index] = (list(rects), list(texts.values()))
+        return edits
+
+    def write_to(self, doc, measure=False):
+        # Materialize every page's edits into doc; returns summed write statistics
+        return write_page_edits(doc, self.edits(), measure=measure)
+
+
+def write_page_edits(doc, per_page, measure=False, progress=None):
+    # Apply {page_index: (erasures, texts)} to doc and sum the write
+    # statistics; progress, if given, is called with the fraction done
+    totals = {"pages": 0, "rects": 0, "fills": 0, "texts": 0, "bytes_written": 0}
+    if measure:
+        totals["bytes_saved"] = 0
+    pages = sorted(per_page)
+    for n, page_index in enumerate(pages, 1):
+        erasures, texts = per_page[page_index]
+        stats = apply_page_edits(doc[page_index], erasures, texts, measure=measure)
+        totals["pages"] += 1
+        for name, value in stats.items():
+            totals[name] += value
+        if progress is not None:
+            progress(n / len(pages))
+    return totals
+
+
+class PixmapCache:
+    # LRU cache of rendered page pixmaps, bounded by a memory budget in bytes.
+    # Keys are (page_index, scale, revision); the revision is bumped whenever
+    # the page content changes, so stale bitmaps are never served.
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (pixmap, size in bytes)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, pix):
+        size = pix.stride * pix.height
+        if _profiler is not None:
+            # Every bitmap the editor rasterizes passes through here
+            _profiler.count("rasterized_bytes", size)
+        if size > self.max_bytes:
+            return  # Never cache a bitmap larger than the whole budget
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (pix, size)
+        self.current_bytes += size
+        # Evict least recently used bitmaps until we fit the budget again
+        while self.current_bytes > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.current_bytes -= old_size
+
+    def invalidate_page(self, page_index):
+        for key in [k for k in self._entries if k[0] == page_index]:
+            self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+
+class SpatialGrid:
+    # Uniform grid of axis-aligned boxes for fast point and rectangle queries.
+    # Each box is registered in every cell it overlaps, so a query only has to
+    # look at the boxes sharing its cells instead of every box on the page.
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self._cells = {}  # (column, row) -> set of keys
+        self._boxes = {}  # key -> (x0, y0, x1, y1)
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _cells_for(self, x0, y0, x1, y1):
+        size = self.cell_size
+        for col in range(int(x0 // size), int(x1 // size) + 1):
+            for row in range(int(y0 // size), int(y1 // size) + 1):
+                yield col, row
+
+    def insert(self, key, box):
+        if key in self._boxes:
+            self.remove(key)
+        self._boxes[key] = box
+        for cell in self._cells_for(*box):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        box = self._boxes.pop(key, None)
+        if box is None:
+            return
+        for cell in self._cells_for(*box):
+            keys = self._cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._boxes.clear()
+
+    def bbox(self, key):
+        return self._boxes.get(key)
+
+    def query_point(self, x, y):
+        size = self.cell_size
+        hits = []
+        for key in self._cells.get((int(x // size), int(y // size)), ()):
+            x0, y0, x1, y1 = self._boxes[key]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                hits.append(key)
+        return hits
+
+    def query_rect(self, x0, y0, x1, y1):
+        hits = set()
+        for cell in self._cells_for(x0, y0, x1, y1):
+            for key in self._cells.get(cell, ()):
+                bx0, by0, bx1, by1 = self._boxes[key]
+                if bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1:
+                    hits.add(key)
+        return list(hits)
+
+
+class PageLayout:
+    # The document's pages stacked vertically, in PDF points, for the
+    # continuous view. Only the page sizes are read, nothing is rendered.
+    gap = 8  # Points between two pages
+
+    def __init__(self, doc):
+        self.tops = array('d')
+        self.widths = array('d')
+        self.heights = array('d')
+        y = 0.0
+        for page in doc:
+            rect = page.rect
+            self.tops.append(y)
+            self.widths.append(rect.width)
+            self.heights.append(rect.height)
+            y += rect.height + self.gap
+        self.width = max(self.widths, default=0.0)
+        self.height = max(0.0, y - self.gap)
+
+    def __len__(self):
+        return len(self.tops)
+
+    def page_at(self, y):
+        # Page at height y; in a gap, the page above it
+        return min(max(bisect.bisect_right(self.tops, y) - 1, 0), len(self.tops) - 1)
+
+    def pages_between(self, y0, y1):
+        return range(self.page_at(y0), self.page_at(y1) + 1)
+
+
+def _file_stamp(path):
+    # (path, size, mtime) of one version of a file, so a worker that keeps a
+    # document open notices when an incremental save replaced the file
+    st = os.stat(path)
+    return (path, st.st_size, st.st_mtime_ns)
+
+
+_prefetch_doc = (None, None)  # (file stamp, document) of a prefetch worker process
+
+
+def _prefetch_worker(source, page_index, scale):
+    # Runs in the prefetch process; the samples go back as bytes, pixmaps can't be pickled
+    global _prefetch_doc
+    stamp = _file_stamp(source)
+    if _prefetch_doc[0] != stamp:
+        if _prefetch_doc[1] is not None:
+            _prefetch_doc[1].close()
+        _prefetch_doc = (stamp, fitz.open(source))
+    pix = _prefetch_doc[1][page_index].get_pixmap(matrix=fitz.Matrix(scale, scale))
+    return pix.width, pix.height, pix.samples
+
+
+class PrefetchScheduler:
+    # Renders the pages around the current one ahead of time so that paging is
+    # served from the PixmapCache. MuPDF holds the GIL while it rasterizes, so
+    # a worker thread would only move the stall of the Tk thread to another
+    # moment; the pages are rendered in a spawned process instead. The Tk
+    # thread polls the jobs with root.after and never waits for one.
+    poll_ms = 30
+
+    def __init__(self, root, cache, window=1, max_workers=1):
+        self.root = root
+        self.cache = cache
+        self.window = window  # Number of pages prefetched on each side
+        self.max_workers = max_workers
+        self._executor = None  # Started with the first job
+        self._futures = {}  # cache key -> Future
+        self._source = None
+        self._poll_job = None
+
+    def set_document(self, source):
+        self.cancel()
+        self._source = source
+
+    def schedule(self, page_index, scale, page_count, revisions):
+        # Drop the jobs of the previous page/zoom before queueing new ones
+        self.cancel()
+        if self._source is None:
+            return
+        for distance in range(1, self.window + 1):
+            for i in (page_index + distance, page_index - distance):
+                # Workers read the file on disk, so only pages without in-memory edits qualify
+                if not 0 <= i < page_count or revisions.get(i, 0):
+                    continue
+                key = (i, scale, 0)
+                if key in self.cache:
+                    continue
+                if self._executor is None:
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                self._futures[key] = self._executor.submit(_prefetch_worker, self._source, i, scale)
+        if self._futures and self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+    def take(self, key):
+        # Called by the Tk thread on a cache miss: use the job's pixmap if it
+        # is finished, otherwise the caller renders the page itself
+        future = self._futures.pop(key, None)
+        if future is None:
+            return None
+        if not future.done():
+            future.cancel()
+            return None
+        return self._pixmap(future)
+
+    def cancel(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+    def shutdown(self):
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self):
+        self._poll_job = None
+        for key in [key for key, future in self._futures.items() if future.done()]:
+            pix = self._pixmap(self._futures.pop(key))
+            if pix is not None:
+                self.cache.put(key, pix)
+        if self._futures:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+    def _pixmap(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return None
+        width, height, samples = future.result()
+        return fitz.Pixmap(fitz.csRGB, width, height, samples, 0)
+
+
+def _user_cache_dir():
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "pdf_whiteout")
+
+
+class ThumbnailCache:
+    # PNG thumbnails on disk, keyed by the content hash of the document and
+    # the page number, so they survive restarts and renames of the file. The
+    # folder is kept under max_bytes by dropping the least recently used files.
+    # Only used from the thumbnail worker thread.
+    def __init__(self, root=None, max_bytes=200 * 1024 * 1024):
+        self.root = root or os.path.join(_user_cache_dir(), "thumbnails")
+        self.max_bytes = max_bytes
+        self._total = None  # Bytes on disk, counted on first write
+
+    def document_key(self, path):
+        # Hashing a big file takes a while, so remember the digest per
+        # (path, size, mtime) and reopening the same file is instant
+        st = os.stat(path)
+        stamp = "%s|%d|%d" % (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        index_path = os.path.join(self.root, "documents.json")
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        if stamp in index:
+            return index[stamp]
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        index[stamp] = digest.hexdigest()
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(index_path + ".part", "w") as f:
+                json.dump(index, f)
+            os.replace(index_path + ".part", index_path)
+        except OSError:
+            pass  # A read-only cache only costs a rehash next time
+        return index[stamp]
+
+    def _path(self, doc_key, page_index, width):
+        return os.path.join(self.root, doc_key, "%d_%d.png" % (page_index, width))
+
+    def get(self, doc_key, page_index, width):
+        path = self._path(doc_key, page_index, width)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used for eviction
+        except OSError:
+            return None
+        return data
+
+    def put(self, doc_key, page_index, width, data):
+        path = self._path(doc_key, page_index, width)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError:
+            return
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self._files())
+        else:
+            self._total += len(data)
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _files(self):
+        files = []
+        try:
+            folders = [entry.path for entry in os.scandir(self.root) if entry.is_dir()]
+        except OSError:
+            return files
+        for folder in folders:
+            for entry in os.scandir(folder):
+                if entry.name.endswith(".png"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _evict(self):
+        # Go down to 90% so that every new thumbnail doesn't trigger a scan
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
+
+
+class ThumbnailLoader:
+    # Produces thumbnail PNGs on a background thread, from the disk cache when
+    # possible and otherwise rendered at low resolution from the worker's own
+    # document handle. Finished images go through a queue that the Tk thread
+    # drains with root.after; the worker never calls into Tk itself.
+    poll_ms = 50
+
+    def __init__(self, root, cache, width=120):
+        self.root = root
+        self.cache = cache
+        self.width = width
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnails")
+        self._futures = {}  # page index -> Future
+        self._results = queue.Queue()  # (generation, page index, PNG data) from the worker
+        self._poll_job = None
+        self._generation = 0
+        self._source = None
+        self._callback = None
+        # Worker thread state
+        self._doc = None
+        self._doc_source = None
+        self._doc_key = None
+
+    def set_document(self, source, callback):
+        self.cancel()
+        self._source = source
+        self._callback = callback
+
+    def request(self, page_index):
+        if self._source is None or page_index in self._futures:
+            return
+        self._futures[page_index] = self._executor.submit(
+            self._load, self._generation, self._source, page_index)
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+    def discard(self, keep):
+        # Drop queued jobs for entries that were scrolled out of view
+        for page_index in [i for i in self._futures if i not in keep]:
+            self._futures.pop(page_index).cancel()
+
+    def cancel(self):
+        self._generation += 1
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _load(self, generation, source, page_index):
+        if generation != self._generation:
+            return
+        stamp = _file_stamp(source)
+        if self._doc_source != stamp:
+            if self._doc is not None:
+                self._doc.close()
+            self._doc = None
+            self._doc_key = self.cache.document_key(source)
+            self._doc_source = stamp
+        data = self.cache.get(self._doc_key, page_index, self.width)
+        if data is None:
+            # Opening is cheap, but only needed when something must be rendered
+            if self._doc is None:
+                self._doc = fitz.open(source)
+            page = self._doc[page_index]
+            zoom = self.width / page.rect.width
+            data = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes("png")
+            self.cache.put(self._doc_key, page_index, self.width, data)
+        self._results.put((generation, page_index, data))
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                generation, page_index, data = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._generation:
+                self._futures.pop(page_index, None)
+                self._callback(page_index, data)
+        # Jobs that failed or were dropped never report back
+        for page_index in [i for i, future in self._futures.items() if future.done() and not future.cancelled() and future.exception()]:
+            del self._futures[page_index]
+        if self._futures:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+
+def clip_edits(rects, texts, width, height):
+    # Rectangles clamped to a width x height page (empty ones dropped) and
+    # text anchors kept on it, as new tuples
+    return (tuple((max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)) for x0, y0, x1, y1 in rects
+                  if max(x0, 0) < min(x1, width) and max(y0, 0) < min(y1, height)),
+            tuple((min(max(x, 0), width), min(max(y, 0), height), text, font_size)
+                  for x, y, text, font_size in texts))
+
+
+def _user_config_dir():
+    base = (os.environ.get("APPDATA") or os.environ.get("XDG_CONFIG_HOME")
+            or os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(base, "pdf_whiteout")
+
+
+class TemplateStore:
+    # Named sets of selections and text in PDF points, for regions that
+    # repeat on many pages (headers, footers, stamps). The file has the shape
+    # of a batch edit spec per name, {"name": {"erasures": [...], "texts": [...]}},
+    # so a template can be copied into a spec as is. Templates are parsed
+    # once into the tuples the journal stores.
+    def __init__(self, path=None):
+        self.path = path or os.path.join(_user_config_dir(), "templates.json")
+        self._raw = None  # name -> spec as stored
+        self._parsed = {}  # name -> (rects, texts)
+
+    def _load(self):
+        # Only a missing file means "no templates". A file that does not parse
+        # raises ValueError and is never cached, so put() cannot overwrite it.
+        if self._raw is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+            except FileNotFoundError:
+                raw = {}
+            except ValueError as e:
+                raise ValueError("%s: %s" % (self.path, e)) from None
+            if not isinstance(raw, dict):
+                raise ValueError("%s: expected an object of templates" % self.path)
+            self._raw = raw
+        return self._raw
+
+    def names(self):
+        return sorted(self._load())
+
+    def get(self, name):
+        # (rects, texts) of the template: rects are (x0, y0, x1, y1),
+        # texts are (x, y, text, font_size)
+        if name not in self._parsed:
+            spec = parse_edit_spec(self._load()[name])
+            self._parsed[name] = (tuple(rect for rect, _ in spec["erasures"]),
+                                  tuple(text for text, _ in spec["texts"]))
+        return self._parsed[name]
+
+    def put(self, name, rects, texts):
+        self._load()[name] = {
+            "erasures": [{"rect": list(rect)} for rect in rects],
+            "texts": [{"x": x, "y": y, "text": text, "font_size": font_size} for x, y, text, font_size in texts],
+        }
+        self._parsed.pop(name, None)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".part", "w", encoding="utf-8") as f:
+            json.dump(self._raw, f, indent=2)
+        os.replace(self.path + ".part", self.path)
+
+
+SAVE_MODES = ("Fast", "Incremental", "Optimize")
+
+
+def _save_pdf_worker(source, per_page, dst, mode, measure, conn):
+    # Runs in a child process: open source, apply the journaled edits and
+    # save the result as dst in one of SAVE_MODES, reporting ("phase", name),
+    # ("progress", fraction) and finally ("done", stats) or ("error", message).
+    # An incremental save appends to a copy of source, which then replaces it.
+    try:
+        if mode == "Incremental":
+            conn.send(("phase", "copying"))
+            shutil.copyfile(source, dst)
+            source = dst
+        doc = fitz.open(source)
+        try:
+            conn.send(("phase", "applying"))
+            stats = write_page_edits(doc, per_page, measure=measure,
+                                     progress=lambda fraction: conn.send(("progress", fraction)))
+            if mode == "Optimize":
+                conn.send(("phase", "optimizing"))
+                # Garbage-collect, deduplicate and deflate
+                doc.save(dst, garbage=4, deflate=True, deflate_images=True, deflate_fonts=True)
+            elif mode == "Incremental":
+                conn.send(("phase", "writing"))
+                doc.save(dst, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+            else:
+                conn.send(("phase", "writing"))
+                doc.save(dst)
+        finally:
+            doc.close()
+        conn.send(("done", stats if per_page else None))
+    except Exception as e:
+        conn.send(("error", "%s: %s" % (type(e).__name__, e)))
+    finally:
+        conn.close()
+
+
+class SaveJob:
+    # Writes source (the path the open document was loaded from) with the
+    # journaled per-page edits applied to path. Opening, editing and
+    # serializing a large document takes MuPDF a long time with the GIL
+    # held, so all of it runs in a spawned child process and the Tk thread
+    # only polls phase and progress. The output is written next to the
+    # target (part) and renamed into place when complete, so a cancelled or
+    # failed save never leaves a partial file. An incremental save rewrites
+    # the open document's own file, so its part is left for the Tk thread to
+    # move into place once it has closed the document.
+    def __init__(self, source, edits, path, mode="Fast", measure=False):
+        self.source = source
+        self.edits = edits  # {page_index: (erasures, texts)}, as from EditJournal.edits()
+        self.path = path
+        self.part = path + ".part"
+        self.mode = mode  # One of SAVE_MODES
+        self.measure = measure
+        self.phase = "queued"
+        self.progress = 0.0  # 0..1 within the current phase
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.stats = None  # Summed write statistics of the edits, once done
+        self.size = 0
+        self.elapsed = 0.0
+        self._process = None
+        self._thread = threading.Thread(target=self._run, name="save", daemon=True)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        process = self._process
+        if process is not None and process.pid is not None:
+            process.terminate()
+
+    def _run(self):
+        part = self.part
+        try:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            context = multiprocessing.get_context("spawn")
+            self._process = context.Process(
+                target=_save_pdf_worker, args=(self.source, self.edits, part, self.mode, self.measure, sender),
+                daemon=True)
+            if not self.cancelled:
+                self._process.start()
+            sender.close()
+            finished = False
+            while not self.cancelled:
+                try:
+                    kind, value = receiver.recv()
+                except EOFError:
+                    break
+                if kind == "phase":
+                    self.phase = value
+                    self.progress = 0.0
+                elif kind == "progress":
+                    self.progress = value
+                elif kind == "done":
+                    self.stats = value
+                    finished = True
+                else:
+                    self.error = value
+            receiver.close()
+            if self._process.pid is not None:
+                if self.cancelled:
+                    self._process.terminate()
+                self._process.join()
+            if not self.cancelled and self.error is None and not finished:
+                self.error = "Save process exited with code %s" % self._process.exitcode
+
+            if not self.cancelled and self.error is None:
+                if self.mode == "Incremental":
+                    self.size = os.path.getsize(part)
+                    part = None  # Moved into place by the Tk thread
+                else:
+                    os.replace(part, self.path)
+                    self.size = os.path.getsize(self.path)
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+        finally:
+            if part is not None and os.path.exists(part):
+                os.remove(part)
+            self.elapsed = time.perf_counter() - self._start
+            if _profiler is not None:
+                _profiler.complete("save_job", "job", self._start, self._start + self.elapsed)
+            self.done = True
+
+
+def _format_size(size):
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024:
+            return "%.0f %s" % (size, unit) if unit == "bytes" else "%.1f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f GB" % size
+
+
+def find_text_rects(page, pattern, regex=False):
+    # Boxes, in PDF points, around every match of pattern on the page.
+    # Literal text uses MuPDF's own search, which ignores case and follows
+    # matches across line breaks. A compiled regular expression is run over
+    # each text line, and a match is boxed by the characters it covers.
+    if not regex:
+        return [tuple(rect) for rect in page.search_for(pattern)]
+    # Character boxes are expensive to extract, so skip pages without a match
+    if not any(pattern.search(line) for line in page.get_text().splitlines()):
+        return []
+    rects = []
+    # No flags: ligatures are split into letters and images are left out
+    for block in page.get_text("rawdict", flags=0)["blocks"]:
+        for line in block.get("lines", ()):
+            chars = [char for span in line["spans"] for char in span["chars"]]
+            text = "".join(char["c"] for char in chars)
+            for match in pattern.finditer(text):
+                boxes = [chars[i]["bbox"] for i in range(match.start(), match.end())]
+                if boxes:
+                    rects.append((min(b[0] for b in boxes), min(b[1] for b in boxes),
+                                  max(b[2] for b in boxes), max(b[3] for b in boxes)))
+    return rects
+
+
+_search_docs = {}  # file stamp -> open document, per search worker process
+
+
+def _search_worker(job):
+    # Runs in a worker process, which keeps its own handle on the document
+    source, first, last, pattern, regex, ignore_case = job
+    stamp = _file_stamp(source)
+    doc = _search_docs.get(stamp)
+    if doc is None:
+        for old in _search_docs.values():
+            old.close()
+        _search_docs.clear()
+        doc = _search_docs[stamp] = fitz.open(source)
+    if regex:
+        pattern = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    found = []
+    for page_index in range(first, last):
+        rects = find_text_rects(doc[page_index], pattern, regex)
+        if rects:
+            found.append((page_index, rects))
+    return found
+
+
+class SearchJob:
+    # Searches every page of a PDF file for a string or regular expression
+    # in a pool of worker processes, a range of pages per task. The Tk thread
+    # polls progress and done; cancel() drops the ranges not yet started.
+    chunk_pages = 25
+
+    def __init__(self, source, page_count, pattern, regex=False, ignore_case=False, workers=None):
+        self.source = source
+        self.page_count = page_count
+        self.pattern = pattern
+        self.regex = regex
+        self.ignore_case = ignore_case
+        self.workers = workers or os.cpu_count() or 1
+        self.matches = {}  # page_index -> list of (x0, y0, x1, y1) in PDF points
+        self.count = 0
+        self.progress = 0.0
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.elapsed = 0.0
+        self._thread = threading.Thread(target=self._run, name="search", daemon=True)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _run(self):
+        jobs = [(self.source, first, min(first + self.chunk_pages, self.page_count),
+                 self.pattern, self.regex, self.ignore_case)
+                for first in range(0, self.page_count, self.chunk_pages)]
+        try:
+            # Spawned rather than forked, the parent process runs Tk
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                                        mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(_search_worker, job) for job in jobs]
+                for finished, future in enumerate(as_completed(futures), 1):
+                    if self.cancelled:
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    for page_index, rects in future.result():
+                        self.matches[page_index] = rects
+                        self.count += len(rects)
+                    self.progress = finished / len(jobs)
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+        finally:
+            self.elapsed = time.perf_counter() - self._start
+            self.done = True
+
+
+def _open_mapped(path):
+    # Open a PDF from a read-only memory map of the file instead of by name.
+    # Releases of PyMuPDF that only take bytes get a copy of the mapping.
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return fitz.open(stream=memoryview(mapping), filetype="pdf"), mapping
+    except (TypeError, ValueError):
+        doc = fitz.open(stream=mapping[:], filetype="pdf")
+        mapping.close()
+        return doc, None
+
+
+def _mupdf_store_size():
+    # Bytes held in MuPDF's resource store (a property in older releases,
+    # None in releases that don't report it)
+    size = fitz.TOOLS.store_size
+    return size() if callable(size) else size
+
+
+def _resident_memory():
+    # Resident set size of this process in bytes, or None where unknown
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _xref_looks_intact(path):
+    # Cheap look at the end of the file: the last startxref has to point at
+    # an xref table or an xref stream object. Files failing this are the ones
+    # MuPDF rebuilds (repairs) when opening them.
+    try:
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 2048))
+            offsets = re.findall(rb"startxref\s+(\d+)", f.read())
+            if not offsets or int(offsets[-1]) >= size:
+                return False
+            f.seek(int(offsets[-1]))
+            head = f.read(64).lstrip()
+    except OSError:
+        return True  # Let the normal open report it
+    return head.startswith(b"xref") or re.match(rb"\d+\s+\d+\s+obj", head) is not None
+
+
+def _repair_worker(path):
+    # Runs in a spawned process: open the file there, and if MuPDF had to
+    # repair it, save the repaired document to a temporary file
+    doc = fitz.open(path)
+    try:
+        if not doc.is_repaired:
+            return None
+        fd, copy = tempfile.mkstemp(prefix="pdf_whiteout-repaired-", suffix=".pdf")
+        os.close(fd)
+        try:
+            doc.save(copy, garbage=1)
+        except Exception:
+            os.remove(copy)
+            raise
+        return copy
+    finally:
+        doc.close()
+
+
+class DocumentLoader:
+    # Opens a PDF and renders its first page on a worker thread. The Tk
+    # thread polls done and then takes over doc, first_pixmap and mapping
+    # (the buffer of in-memory documents). MuPDF holds the GIL inside each
+    # call, so a long repair on this thread would stall the window. Files
+    # whose xref looks broken are therefore opened in a spawned child first,
+    # and when MuPDF repairs them there the child writes a repaired copy
+    # (repaired_copy) that this process opens instead.
+    def __init__(self, path, scale, in_memory=False, max_pixels=None):
+        self.path = path
+        self.scale = scale
+        self.in_memory = in_memory
+        self.max_pixels = max_pixels  # Skip the first render for pages this large, they are tiled
+        self.doc = None
+        self.first_pixmap = None
+        self.mapping = None
+        self.repaired_copy = None  # Temporary file the document was opened from, if it was repaired
+        self.done = False
+        self.error = None
+        self.elapsed = 0.0
+        self._thread = threading.Thread(target=self._run, name="load", daemon=True)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            source = self.path
+            if not _xref_looks_intact(self.path):
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    self.repaired_copy = pool.submit(_repair_worker, self.path).result()
+                source = self.repaired_copy or self.path
+            if self.in_memory:
+                self.doc, self.mapping = _open_mapped(source)
+            else:
+                self.doc = fitz.open(source)
+            if self.doc.page_count == 0:
+                raise ValueError("The document has no pages")
+            page = self.doc[0]
+            if self.max_pixels is None or page.rect.width * page.rect.height * self.scale ** 2 <= self.max_pixels:
+                self.first_pixmap = page.get_pixmap(matrix=fitz.Matrix(self.scale, self.scale))
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+            if self.doc is not None:
+                self.doc.close()
+                self.doc = None
+            if self.repaired_copy is not None:
+                os.remove(self.repaired_copy)
+                self.repaired_copy = None
+        finally:
+            self.elapsed = time.perf_counter() - self._start
+            if _profiler is not None:
+                _profiler.complete("document_load", "job", self._start, self._start + self.elapsed)
+            self.done = True
+
+
+def _pixmap_to_image(pix):
+    # Pillow image reading the samples straight from the pixmap's buffer,
+    # with no PPM encoding in between (Pillow maps RGBA in place and unpacks
+    # RGB in one pass). It shares the pixmap's memory, so use it while the
+    # pixmap is alive.
+    mode = {1: "L", 3: "RGB", 4: "RGBA"}[pix.n]
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+
+
+TILE_SIZE = 512  # Tile edge in screen pixels
+TILE_MIN_PIXELS = 2048 * 2048  # Pages larger than this at the current zoom are tiled
+
+
+def tile_clip(page_rect, scale, col, row, size=TILE_SIZE):
+    # Page area, in PDF points, of the tile at (col, row) of a page drawn at scale
+    width = math.ceil(page_rect.width * scale)
+    height = math.ceil(page_rect.height * scale)
+    x0, y0 = page_rect.x0, page_rect.y0
+    return fitz.Rect(x0 + col * size / scale, y0 + row * size / scale,
+                     x0 + min((col + 1) * size, width) / scale, y0 + min((row + 1) * size, height) / scale)
+
+
+def render_tiles(page, scale, tiles, size=TILE_SIZE):
+    # {(col, row): pixmap} of the given tiles of a page. They are rasterized
+    # as one clip around all of them and cut apart afterwards: every clip
+    # decodes a scanned page's image again, so one clip per tile made tiling
+    # slower than rendering the whole page.
+    clips = {tile: tile_clip(page.rect, scale, tile[0], tile[1], size) for tile in tiles}
+    union = None
+    for clip in clips.values():
+        union = fitz.Rect(clip) if union is None else union | clip
+    matrix = fitz.Matrix(scale, scale)
+    region = page.get_pixmap(matrix=matrix, clip=union)
+    if len(clips) == 1:
+        return {tile: region for tile in clips}
+    pixmaps = {}
+    for tile, clip in clips.items():
+        irect = (clip * matrix).irect & fitz.IRect(region.irect)
+        pix = fitz.Pixmap(region.colorspace, irect, region.alpha)
+        pix.copy(region, irect)
+        pixmaps[tile] = pix
+    return pixmaps
+
 
 class PDFEditorApp:
     def __init__(self, root):
@@ -14,6 +1434,23 @@ class PDFEditorApp:
         help_frame.pack(fill=tk.X)
         tk.Button(help_frame, text="Help", command=self.show_help).pack(side=tk.RIGHT, padx=5, pady=3)
 
+        # Status bar at the bottom of the window
+        self.status_var = tk.StringVar(value="")
+        tk.Label(self.root, textvariable=self.status_var, anchor="w").pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Page thumbnails on the left
+        self.thumb_width = 120  # Thumbnail width in pixels
+        self.thumb_pad = 8
+        self.thumb_frame = tk.Frame(self.root)
+        self.thumb_frame.pack(side=tk.LEFT, fill=tk.Y)
+        self.thumb_scrollbar = tk.Scrollbar(self.thumb_frame)
+        self.thumb_canvas = tk.Canvas(self.thumb_frame, width=self.thumb_width + 2 * self.thumb_pad,
+                                      bg="gray30", highlightthickness=0,
+                                      yscrollcommand=self._on_thumb_yscroll)
+        self.thumb_scrollbar.config(command=self.thumb_canvas.yview)
+        self.thumb_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.thumb_canvas.pack(side=tk.LEFT, fill=tk.Y)
+
         # Create a frame to hold the canvas and scrollbars
         self.canvas_frame = tk.Frame(self.root)
         self.canvas_frame.pack(fill=tk.BOTH, expand=True)
@@ -24,8 +1461,8 @@ class PDFEditorApp:
         
         # Create canvas with scrollbars
         self.canvas = tk.Canvas(self.canvas_frame, cursor="cross", bg="gray",
-                              yscrollcommand=self.v_scrollbar.set,
-                              xscrollcommand=self.h_scrollbar.set)
+                              yscrollcommand=self._on_canvas_yscroll,
+                              xscrollcommand=self._on_canvas_xscroll)
         
         # Configure scrollbars
         self.v_scrollbar.config(command=self.canvas.yview)
@@ -44,17 +1481,54 @@ class PDFEditorApp:
         self.page_index = 0
         self.tk_img = None
         self.image_id = None
-
-        self.scale = 2.0
+        self.background_key = None  # Cache key of the bitmap currently shown in image_id
+        self.pixmap_cache = PixmapCache()
+        self.tiled = False  # True when the page is drawn as viewport tiles instead of one image
+        self.tile_size = TILE_SIZE
+        self.tile_min_pixels = TILE_MIN_PIXELS
+        self.tile_items = {}  # (page, column, row) -> (canvas item id, PhotoImage) of the tiles on the canvas
+        self._tile_job = None
+        self.continuous = False  # Scroll through all pages instead of showing one at a time
+        self.layout = None  # PageLayout of the document, built when the continuous view is first used
+        self.visible_pages = ()  # Pages with tiles on the canvas in the continuous view
+        self.prefetcher = PrefetchScheduler(self.root, self.pixmap_cache, window=1)
+        self.page_revisions = {}  # page_index -> content revision, bumped when the document's page changes
+        self.thumbnails = ThumbnailLoader(self.root, ThumbnailCache(), width=self.thumb_width)
+        self.thumb_slot = 0  # Height of one sidebar entry in pixels, from the first page's aspect ratio
+        self.thumb_items = {}  # page_index -> canvas items of the entries in view
+        self.thumb_images = {}  # page_index -> PhotoImage of the entries in view
+        self._thumb_job = None
+
+        self.default_scale = 2.0
+        self.scale = self.default_scale
         self.scale_step = 0.25
         self.min_scale = 1.0
         self.max_scale = 5.0
+        self.zoom_settle_ms = 150  # Quiet time after the last zoom step before the page is rendered crisp
+        self._zoom_job = None  # Pending crisp render; set while a zoom gesture is in progress
+        self._preview_item = None  # Canvas image of the resampled preview shown while zooming
+        self._preview_photo = None
+        self._preview_base = None  # (scale, PIL image) the preview is resampled from
 
         self.start_x = self.start_y = 0
         self.rect = None
-        self.erasures = []  # list of (x0, y0, x1, y1)
-        self.text_annotations = []  # list of (x, y, text, text_id, font_size)
+        self.edits = EditStore()  # Pending edits of the current page, in PDF points
+        self.erasures = self.edits.erasures  # RectColumns of whiteout selections
+        self.text_annotations = self.edits.texts  # TextColumns of text to insert
+        self.overlay_scale = self.scale  # Zoom the overlay canvas items were drawn at
         self.selected_text_index = -1  # Index of selected text annotation
+        self.text_index = SpatialGrid()  # text item id -> canvas bbox of each text annotation
+        self._text_index_scale = None  # Zoom text_index was built at; rebuilt lazily after zooming
+        self.journal = EditJournal()  # Applied edits of every page, written into the PDF on save
+        self.committed_items = {}  # journal text key -> canvas item of the current page
+        self.committed_index = SpatialGrid()  # journal text key -> canvas bbox
+        self._committed_key = None  # (page, journal version, visible pages) the committed layer was drawn for
+        self.committed_scale = self.scale  # Zoom the committed layer was drawn at
+        self._committed_texts = []  # (canvas item, page_index, journal key or None, x, y, text, font_size)
+        self.selected_committed_key = None  # Journal text being dragged
+        self._fonts = {}  # Tk font -> tkfont.Font used for measuring
+        self._text_sizes = {}  # (text, Tk font) -> (width, height) in pixels
+        self._descents = {}  # Tk font -> descent in pixels, for placing applied text on its baseline
         self.current_font_size = 12  # Default font size
         self.dragging_text = False  # Flag to track if we're dragging text
         self.drag_start_x = 0  # Starting X position for drag
@@ -64,6 +1538,60 @@ class PDFEditorApp:
         self.selection_rects = []  # To show selection rectangles on canvas (red border)
         self.text_mode = False  # Flag to track if we're in text addition mode
 
+        self.save_job = None  # Active SaveJob, if any
+        self.save_progress = None  # Progress bar frame, built on the first save
+        self.autosaved_version = 0  # journal.version at the last autosave
+        self.autosave_interval = 2 * 60 * 1000  # Milliseconds between autosave checks
+        self.autosave_dir = os.path.join(tempfile.gettempdir(), "pdf_whiteout_autosave")
+        self.loader = None  # DocumentLoader of the file being opened
+        self.doc_path = None  # File the document was opened from
+        self.doc_source = None  # File worker processes read: doc_path, or its repaired copy
+        self.load_in_memory = False  # Open documents from a memory map of the file instead of by name
+        self._mapping = None  # Memory map backing the open document, if any
+        self._incremental_hold = None  # Journal operations held by a running incremental save
+        self.store_limit = 128 * 1024 * 1024  # Cap on MuPDF's resource store in bytes, 0 for MuPDF's own limit
+        self.search_job = None  # Active SearchJob, if any
+        self.search_progress = None  # Progress bar frame, built on the first search
+        self.search_matches = {}  # page_index -> search matches not yet shown as pending selections
+        self.templates = TemplateStore()
+        self.last_template = None  # Name of the template applied or saved last
+        self.perf_overlay = False  # Show frame time and cache counters in the corner of the canvas
+        self.profile_path = None  # Where the trace is written when the window closes
+        self._perf_job = None
+        self.root.after(self.autosave_interval, self._autosave_tick)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def _on_canvas_yscroll(self, first, last):
+        self.v_scrollbar.set(first, last)
+        self._schedule_tile_update()
+        self._schedule_perf_overlay()
+
+    def _on_canvas_xscroll(self, first, last):
+        self.h_scrollbar.set(first, last)
+        self._schedule_tile_update()
+        self._schedule_perf_overlay()
+
+    def _on_thumb_yscroll(self, first, last):
+        self.thumb_scrollbar.set(first, last)
+        self._schedule_thumbnail_update()
+
+    def on_close(self):
+        if self.save_job is not None and not self.save_job.done:
+            if not messagebox.askyesno("Save in Progress", "A save is still running. Cancel it and quit?"):
+                return
+            self.save_job.cancel()
+        if self.search_job is not None:
+            self.search_job.cancel()
+        self.prefetcher.shutdown()
+        self.thumbnails.shutdown()
+        if self.doc is not None:
+            self.doc.close()
+        self._remove_repaired_copy()
+        if self.profile_path and _profiler is not None:
+            _profiler.export(self.profile_path)
+        self.root.destroy()
+
     def show_help(self):
         help_text = (
             "Keyboard Shortcuts:\n"
@@ -71,6 +1599,7 @@ class PDFEditorApp:
             "Up / Down Arrow: Navigate previous / next page\n"
             "Enter: Apply erase to selected area(s)\n"
             "Ctrl + S: Save PDF\n"
+            "Ctrl + Z / Ctrl + Y: Undo / Redo applied changes on this page\n"
             "Mouse Wheel: Zoom In / Zoom Out\n"
             "\n"
             "Use mouse drag to select area to erase.\n"
@@ -85,6 +1614,7 @@ class PDFEditorApp:
             "Right-click and drag to move text to a new position.\n"
             "Use the font size selector to change text size for new text.\n"
             "Click 'Apply' to save text changes to the page.\n"
+            "Applied text can still be resized, moved or removed.\n"
             "\n"
             "Text Removal:\n"
             "Click 'Remove Text' to enter removal mode.\n"
@@ -108,6 +1638,16 @@ class PDFEditorApp:
         self.apply_btn.pack(side=tk.LEFT)
         self.save_btn = tk.Button(btn_frame, text="Save PDF", command=self.save_pdf, state=tk.DISABLED)
         self.save_btn.pack(side=tk.LEFT)
+        self.save_mode_var = tk.StringVar(value=SAVE_MODES[0])
+        ttk.Combobox(btn_frame, textvariable=self.save_mode_var, values=SAVE_MODES,
+                     width=11, state="readonly").pack(side=tk.LEFT)
+        self.autosave_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Autosave", variable=self.autosave_var).pack(side=tk.LEFT)
+
+        self.undo_btn = tk.Button(btn_frame, text="Undo", command=self.undo, state=tk.DISABLED)
+        self.undo_btn.pack(side=tk.LEFT)
+        self.redo_btn = tk.Button(btn_frame, text="Redo", command=self.redo, state=tk.DISABLED)
+        self.redo_btn.pack(side=tk.LEFT)
 
         tk.Button(btn_frame, text="Unselect Latest", command=self.unselect_latest, state=tk.DISABLED).pack(side=tk.LEFT)
         tk.Button(btn_frame, text="Unselect All", command=self.unselect_all, state=tk.DISABLED).pack(side=tk.LEFT)
@@ -118,6 +1658,18 @@ class PDFEditorApp:
         self.remove_text_btn = tk.Button(btn_frame, text="Remove Text", command=self.toggle_remove_text_mode, state=tk.DISABLED)
         self.remove_text_btn.pack(side=tk.LEFT)
 
+        self.find_btn = tk.Button(btn_frame, text="Find", command=self.find_text, state=tk.DISABLED)
+        self.find_btn.pack(side=tk.LEFT)
+        self.apply_matches_btn = tk.Button(btn_frame, text="Apply Matches", command=self.apply_matches,
+                                           state=tk.DISABLED)
+        self.apply_matches_btn.pack(side=tk.LEFT)
+        self.save_template_btn = tk.Button(btn_frame, text="Save Template", command=self.save_template,
+                                           state=tk.DISABLED)
+        self.save_template_btn.pack(side=tk.LEFT)
+        self.apply_template_btn = tk.Button(btn_frame, text="Apply Template", command=self.apply_template,
+                                            state=tk.DISABLED)
+        self.apply_template_btn.pack(side=tk.LEFT)
+
         # Add font size selector
         tk.Label(btn_frame, text="Font Size:").pack(side=tk.LEFT, padx=(10, 0))
         self.font_size_var = tk.StringVar(value="12")
@@ -129,6 +1681,9 @@ class PDFEditorApp:
 
         tk.Button(btn_frame, text="Zoom In", command=self.zoom_in).pack(side=tk.RIGHT)
         tk.Button(btn_frame, text="Zoom Out", command=self.zoom_out).pack(side=tk.RIGHT)
+        self.continuous_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Continuous", variable=self.continuous_var,
+                       command=self.toggle_continuous).pack(side=tk.RIGHT)
 
     def toggle_remove_text_mode(self):
         if self.text_mode:
@@ -180,9 +1735,17 @@ class PDFEditorApp:
         self.canvas.bind("<B3-Motion>", self.on_right_drag)       # Right mouse drag
         self.canvas.bind("<ButtonRelease-3>", self.on_right_release)  # Right mouse release
         self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Configure>", lambda event: self._schedule_tile_update())
+        self.thumb_canvas.bind("<ButtonPress-1>", self.on_thumbnail_click)
+        self.thumb_canvas.bind("<MouseWheel>", lambda event: self.thumb_canvas.yview_scroll(-1 if event.delta > 0 else 1, "units"))
+        self.thumb_canvas.bind("<Configure>", lambda event: self._schedule_thumbnail_update())
 
         self.root.bind("<Return>", self.apply_erasure_event)
         self.root.bind("<Control-s>", self.save_pdf_event)
+        self.root.bind("<Control-z>", lambda event: self.undo())
+        self.root.bind("<Control-y>", lambda event: self.redo())
+        self.root.bind("<Control-f>", lambda event: self.find_text())
+        self.root.bind("<F12>", lambda event: self.toggle_perf_overlay())
         self.root.bind("<Up>", self.prev_page_event)
         self.root.bind("<Down>", self.next_page_event)
 
@@ -190,23 +1753,27 @@ class PDFEditorApp:
         self.canvas.bind("<Up>", self.prev_page_event)
         self.canvas.bind("<Down>", self.next_page_event)
 
+    @profiled("input")
     def on_start(self, event):
+        self._focus_page_at(event)
         if self.remove_text_mode:
             x = self.canvas.canvasx(event.x)
             y = self.canvas.canvasy(event.y)
             
             # Check if clicked on existing text
-            for i, (tx, ty, text, _, font_size) in enumerate(self.text_annotations):
-                # Create a temporary text item to get its bbox
-                temp_text = self.canvas.create_text(tx, ty, text=text, anchor="nw", font=("Arial", font_size))
-                bbox = self.canvas.bbox(temp_text)
-                self.canvas.delete(temp_text)
-                
-                if bbox and x >= bbox[0] and x <= bbox[2] and y >= bbox[1] and y <= bbox[3]:
-                    # Remove the clicked text
-                    self.text_annotations.pop(i)
-                    self.render_page()
-                    return
+            i = self._text_at(x, y)
+            if i >= 0:
+                # Remove the clicked text
+                _, text_id = self.text_annotations.pop(i)
+                self.text_index.remove(text_id)
+                self.canvas.delete(text_id)
+                return
+
+            text_key = self._committed_text_at(x, y)
+            if text_key is not None:
+                # Applied text is removed through the journal, so it can be undone
+                self.journal.record(self.page_index, ("remove", text_key))
+                self.render_page()
             return
 
         if self.text_mode:
@@ -214,40 +1781,51 @@ class PDFEditorApp:
             y = self.canvas.canvasy(event.y)
             
             # Check if clicked on existing text
-            for i, (tx, ty, text, _, font_size) in enumerate(self.text_annotations):
-                # Create a temporary text item to get its bbox
-                temp_text = self.canvas.create_text(tx, ty, text=text, anchor="nw", font=("Arial", font_size))
-                bbox = self.canvas.bbox(temp_text)
-                self.canvas.delete(temp_text)
-                
-                if bbox and x >= bbox[0] and x <= bbox[2] and y >= bbox[1] and y <= bbox[3]:
-                    # Ask for new font size
-                    new_size = simpledialog.askinteger("Change Font Size", 
-                                                     "Enter new font size:",
-                                                     initialvalue=font_size,
-                                                     minvalue=8,
-                                                     maxvalue=72)
-                    if new_size:
-                        # Update the font size
-                        self.text_annotations[i] = (tx, ty, text, None, new_size)
-                        self.font_size_var.set(str(new_size))  # Update the font size selector
-                        self.current_font_size = new_size
-                        self.render_page()
-                    return
+            i = self._text_at(x, y)
+            if i >= 0:
+                tx, ty, text, font_size = self.text_annotations[i]
+                # Ask for new font size
+                new_size = simpledialog.askinteger("Change Font Size", 
+                                                 "Enter new font size:",
+                                                 initialvalue=int(font_size),
+                                                 minvalue=8,
+                                                 maxvalue=72)
+                if new_size:
+                    # Update the font size
+                    self._update_text(i, tx * self.scale, ty * self.scale, new_size)
+                    self.font_size_var.set(str(new_size))  # Update the font size selector
+                    self.current_font_size = new_size
+                return
+
+            text_key = self._committed_text_at(x, y)
+            if text_key is not None:
+                font_size = self.journal.state(self.page_index)[1][text_key][3]
+                new_size = simpledialog.askinteger("Change Font Size",
+                                                 "Enter new font size:",
+                                                 initialvalue=int(font_size),
+                                                 minvalue=8,
+                                                 maxvalue=72)
+                if new_size:
+                    self.journal.record(self.page_index, ("resize", text_key, new_size))
+                    self.font_size_var.set(str(new_size))
+                    self.current_font_size = new_size
+                    self.render_page()
+                return
             
             # If not clicked on existing text, add new text
             text = simpledialog.askstring("Add Text", "Enter text to add:")
             if text:
                 text_id = self.canvas.create_text(x, y, text=text, fill="black", anchor="nw", 
-                                                font=("Arial", self.current_font_size))
-                self.text_annotations.append((x, y, text, text_id, self.current_font_size))
-                self.render_page()
+                                                font=self._tk_font(self.current_font_size), tags="overlay")
+                self.text_annotations.append(x / self.scale, y / self.scale, text, self.current_font_size, text_id)
+                self._index_text(len(self.text_annotations) - 1)
             return
 
         self.start_x = self.canvas.canvasx(event.x)
         self.start_y = self.canvas.canvasy(event.y)
         self.rect = self.canvas.create_rectangle(self.start_x, self.start_y, self.start_x, self.start_y, outline="red")
 
+    @profiled("input")
     def on_drag(self, event):
         if self.text_mode and self.dragging_text and self.selected_text_index >= 0:
             x = self.canvas.canvasx(event.x)
@@ -257,12 +1835,8 @@ class PDFEditorApp:
             new_x = x - self.drag_start_x
             new_y = y - self.drag_start_y
             
-            # Update the text position in the annotations list
-            x, y, text, _, font_size = self.text_annotations[self.selected_text_index]
-            self.text_annotations[self.selected_text_index] = (new_x, new_y, text, _, font_size)
-            
-            # Redraw the page to show the new position
-            self.render_page()
+            # Move the existing canvas item in place
+            self._update_text(self.selected_text_index, new_x, new_y)
             return
 
         if self.rect:
@@ -270,6 +1844,7 @@ class PDFEditorApp:
             cur_y = self.canvas.canvasy(event.y)
             self.canvas.coords(self.rect, self.start_x, self.start_y, cur_x, cur_y)
 
+    @profiled("input")
     def on_release(self, event):
         if self.text_mode and self.dragging_text:
             self.dragging_text = False
@@ -280,90 +1855,789 @@ class PDFEditorApp:
         if self.rect:
             x0, y0 = self.start_x, self.start_y
             x1, y1 = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-            self.erasures.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+            # Store the selection in PDF points
+            self.erasures.append(x0 / self.scale, y0 / self.scale, x1 / self.scale, y1 / self.scale)
 
             # Keep the rectangle visible
+            self.canvas.addtag_withtag("overlay", self.rect)
             self.selection_rects.append(self.rect)
             self.rect = None
 
             self.update_unselect_buttons()
 
+    @profiled("edit")
     def apply_erasure(self):
         if not self.erasures and not self.text_annotations:
             messagebox.showinfo("No Changes", "No changes to apply.")
             return
 
-        # Apply erasures
-        for x0, y0, x1, y1 in self.erasures:
-            pdf_x0 = x0 / self.scale
-            pdf_y0 = y0 / self.scale
-            pdf_x1 = x1 / self.scale
-            pdf_y1 = y1 / self.scale
-            rect = fitz.Rect(pdf_x0, pdf_y0, pdf_x1, pdf_y1)
-            self.page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1), overlay=True)
-
-        # Apply text annotations
-        for x, y, text, _, font_size in self.text_annotations:
-            pdf_x = x / self.scale
-            pdf_y = y / self.scale
-            self.page.insert_text((pdf_x, pdf_y), text, fontsize=font_size)
+        # Record the selections and text, trimmed to the page, in the journal.
+        # They are only written into the document when saving.
+        self.edits.clip(self.page.rect)
+        texts = tuple((self.journal.new_key(),) + row for row in self.text_annotations)
+        self.journal.record(self.page_index, ("apply", tuple(self.erasures), texts))
+        self.status_var.set("Applied %d selection(s) and %d text(s) to page %d" % (
+            len(self.erasures), len(texts), self.page_index + 1))
 
         # Clear the temporary annotations
         self.erasures.clear()
-        self.text_annotations.clear()
+        self.clear_text_annotations()
         self.clear_selection_rects()
         self.render_page()
         self.update_unselect_buttons()
 
+    @profiled("edit")
+    def undo(self):
+        if self.doc and self.journal.undo(self.page_index):
+            self.render_page()
+
+    @profiled("edit")
+    def redo(self):
+        if self.doc and self.journal.redo(self.page_index):
+            self.render_page()
+
+    @profiled("io")
     def save_pdf(self):
-        path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
-        if path:
-            # Apply erasures
-            for x0, y0, x1, y1 in self.erasures:
-                # Convert screen coordinates back to PDF coordinates
-                pdf_x0 = x0 / self.scale
-                pdf_y0 = y0 / self.scale
-                pdf_x1 = x1 / self.scale
-                pdf_y1 = y1 / self.scale
-                rect = fitz.Rect(pdf_x0, pdf_y0, pdf_x1, pdf_y1)
-                self.page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1), overlay=True)
-
-            # Apply text annotations
-            for x, y, text, _, font_size in self.text_annotations:
-                # Convert screen coordinates back to PDF coordinates
-                pdf_x = x / self.scale
-                pdf_y = y / self.scale
-                self.page.insert_text((pdf_x, pdf_y), text, fontsize=font_size)
-
-            self.doc.save(path)
-
-    def render_page(self):
-        matrix = fitz.Matrix(self.scale, self.scale)
-        pix = self.page.get_pixmap(matrix=matrix)
-        img = Image.open(io.BytesIO(pix.tobytes("ppm")))
-        self.tk_img = ImageTk.PhotoImage(img)
-
-        self.canvas.delete("all")
-        self.image_id = self.canvas.create_image(0, 0, image=self.tk_img, anchor="nw")
-
-        # Draw current selection rectangles (red outlines)
-        for x0, y0, x1, y1 in self.erasures:
-            r = self.canvas.create_rectangle(x0, y0, x1, y1, outline="red", width=2)
-            self.selection_rects.append(r)
+        if self.save_job is not None and not self.save_job.done:
+            messagebox.showinfo("Save in Progress", "Please wait for the current save to finish.")
+            return
 
-        # Draw text annotations
-        for x, y, text, _, font_size in self.text_annotations:
-            text_id = self.canvas.create_text(x, y, text=text, fill="black", anchor="nw", 
-                                            font=("Arial", font_size))
-            # Update the text_id in the annotations list
-            self.text_annotations[self.text_annotations.index((x, y, text, _, font_size))] = (x, y, text, text_id, font_size)
+        mode = self.save_mode_var.get()
+        if mode == "Incremental":
+            # Append-only update of the file the document was opened from
+            if self.doc_source != self.doc_path:
+                messagebox.showerror("Save Error", "This document was repaired when it was opened and cannot be saved incrementally.")
+                return
+            if not self.doc.name:
+                messagebox.showerror("Save Error", "Documents opened in memory cannot be saved incrementally.")
+                return
+            if not self.doc.can_save_incrementally():
+                messagebox.showerror("Save Error", "This document cannot be saved incrementally.")
+                return
+            path = self.doc.name
+        else:
+            path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+            if not path:
+                return
+            if os.path.abspath(path) == os.path.abspath(self.doc_path):
+                messagebox.showerror("Save Error", "Use the Incremental save mode to overwrite the open file.")
+                return
+
+        # Unapplied selections and text are saved too
+        if self.erasures or self.text_annotations:
+            self.apply_erasure()
+
+        # Applying the edits and writing the file run in a child process
+        self._start_save_job(path, mode)
+
+    def _start_save_job(self, path, mode="Fast"):
+        # The child reopens the file the document was loaded from, which
+        # holds everything but the journal (incremental saves drop what they
+        # wrote), and applies the journaled edits there, so the open document
+        # stays pristine and the preview and undo history keep working
+        edits = self.journal.edits()
+        if mode == "Incremental":
+            # Editing goes on during the save, but what is being written can't be undone
+            self._incremental_hold = self.journal.hold()
+            self._draw_committed()  # Updates the undo button
+        # Estimating the batching savings costs a scratch write per page; skip it on big sessions
+        self.save_job = SaveJob(self.doc_source, edits, path, mode=mode, measure=len(edits) <= 20).start()
+        self._show_save_progress()
+        self._poll_save_job()
+
+    def _finish_incremental_save(self, job):
+        # Swap the saved copy in for the open file and reopen it, so the
+        # held operations are now page content. Returns an error message or None.
+        held, self._incremental_hold = self._incremental_hold, None
+        # The hold is gone if another document was opened meanwhile
+        reopen = held is not None and self.doc is not None
+        if reopen:
+            self.doc.close()  # Some platforms can't replace an open file
+            self.doc = self._mapping = None
+        error = None
+        try:
+            os.replace(job.part, job.path)
+        except OSError as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            os.remove(job.part)
+        if not reopen:
+            return error
+        if self.load_in_memory:
+            self.doc, self._mapping = _open_mapped(job.path)
+        else:
+            self.doc = fitz.open(job.path)
+        self.page = self.doc[self.page_index]
+        self.journal.release(held, written=error is None)
+        if error is None:
+            for page_index in held:
+                self._bump_page_revision(page_index)
+        self.render_page()
+        return error
+
+    def _show_save_progress(self):
+        if self.save_progress is None:
+            self.save_progress = tk.Frame(self.root)
+            self.save_progress_bar = ttk.Progressbar(self.save_progress, length=200, maximum=1.0)
+            self.save_progress_bar.pack(side=tk.LEFT, padx=5)
+            tk.Button(self.save_progress, text="Cancel Save", command=self.cancel_save).pack(side=tk.LEFT)
+        self.save_progress_bar.config(mode="determinate", value=0)
+        self.save_progress.pack(side=tk.BOTTOM, fill=tk.X)
+
+    def cancel_save(self):
+        if self.save_job is not None:
+            self.save_job.cancel()
+
+    def _poll_save_job(self):
+        job = self.save_job
+        if not job.done:
+            if job.phase in ("copying", "writing", "optimizing"):
+                # MuPDF gives no progress while saving, so just show activity
+                if str(self.save_progress_bar.cget("mode")) != "indeterminate":
+                    self.save_progress_bar.config(mode="indeterminate")
+                    self.save_progress_bar.start(15)
+                self.status_var.set("Saving %s (%s)..." % (os.path.basename(job.path), job.phase))
+            else:
+                if str(self.save_progress_bar.cget("mode")) != "determinate":
+                    self.save_progress_bar.stop()
+                    self.save_progress_bar.config(mode="determinate")
+                self.save_progress_bar.config(value=job.progress)
+                self.status_var.set("Saving %s (%s, %.0f%%)..." % (
+                    os.path.basename(job.path), job.phase, job.progress * 100))
+            self.root.after(100, self._poll_save_job)
+            return
 
-        # Update scroll region to match the image size
-        self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
-        
-        # Reset scroll position to top-left
-        self.canvas.xview_moveto(0)
-        self.canvas.yview_moveto(0)
+        self.save_progress_bar.stop()
+        self.save_progress.pack_forget()
+        if job.mode == "Incremental":
+            if job.cancelled or job.error:
+                if self._incremental_hold is not None:
+                    self.journal.release(self._incremental_hold, written=False)
+                    self._incremental_hold = None
+                    self._draw_committed()
+            else:
+                job.error = self._finish_incremental_save(job)
+        if job.cancelled:
+            self.status_var.set("Save cancelled")
+        elif job.error:
+            self.status_var.set("Save failed")
+            messagebox.showerror("Save Error", job.error)
+        else:
+            message = "Saved %s in %.2fs, %s%s" % (
+                os.path.basename(job.path), job.elapsed, _format_size(job.size),
+                {"Optimize": " (optimized)", "Incremental": " incrementally (saved edits can no longer be undone)"}
+                .get(job.mode, ""))
+            stats = job.stats
+            if stats:
+                message += "; %d selection(s) written as %d fill(s) and %d text(s) on %d page(s)" % (
+                    stats["rects"], stats["fills"], stats["texts"], stats["pages"])
+                if stats.get("bytes_saved", 0) > 0:
+                    message += ", %d content bytes saved by batching" % stats["bytes_saved"]
+            self.status_var.set(message)
+
+    def find_text(self):
+        if not self.doc:
+            return
+        if self.search_job is not None and not self.search_job.done:
+            messagebox.showinfo("Search in Progress", "Please wait for the current search to finish.")
+            return
+        query = simpledialog.askstring(
+            "Find and White Out", "Text to find (/pattern/ for a regular expression, /pattern/i to ignore case):",
+            parent=self.root)
+        if not query:
+            return
+
+        regex = ignore_case = False
+        if len(query) > 2 and query.startswith("/") and (query.endswith("/") or query.endswith("/i")):
+            regex = True
+            ignore_case = query.endswith("/i")
+            query = query[1:-2] if ignore_case else query[1:-1]
+            try:
+                re.compile(query)
+            except re.error as e:
+                messagebox.showerror("Find", "Invalid regular expression: %s" % e)
+                return
+
+        # Workers search the file on disk, every page in parallel
+        self.search_job = SearchJob(self.doc_source, self.doc.page_count, query, regex, ignore_case).start()
+        self._show_search_progress()
+        self.root.after(100, self._poll_search_job)
+
+    def _show_search_progress(self):
+        if self.search_progress is None:
+            self.search_progress = tk.Frame(self.root)
+            self.search_progress_bar = ttk.Progressbar(self.search_progress, length=200, maximum=1.0)
+            self.search_progress_bar.pack(side=tk.LEFT, padx=5)
+            tk.Button(self.search_progress, text="Cancel Search", command=self.cancel_search).pack(side=tk.LEFT)
+        self.search_progress_bar.config(value=0)
+        self.search_progress.pack(side=tk.BOTTOM, fill=tk.X)
+
+    def cancel_search(self):
+        if self.search_job is not None:
+            self.search_job.cancel()
+
+    def _poll_search_job(self):
+        job = self.search_job
+        if not job.done:
+            self.search_progress_bar.config(value=job.progress)
+            self.status_var.set("Searching (%.0f%%), %d match(es) so far..." % (job.progress * 100, job.count))
+            self.root.after(100, self._poll_search_job)
+            return
+
+        self.search_progress.pack_forget()
+        if job.cancelled:
+            self.status_var.set("Search cancelled")
+        elif job.error:
+            self.status_var.set("Search failed")
+            messagebox.showerror("Find", job.error)
+        else:
+            self.status_var.set("Found %d match(es) on %d page(s) in %.2fs" % (
+                job.count, len(job.matches), job.elapsed))
+            self.search_matches = dict(job.matches)
+            self._show_matches()
+            self.apply_matches_btn.config(state=tk.NORMAL if job.matches else tk.DISABLED)
+
+    def _show_matches(self):
+        # The matches on the current page become pending selections, so they
+        # can be reviewed and unselected like the ones drawn by hand
+        rects = self.search_matches.pop(self.page_index, None)
+        if not rects:
+            return
+        for x0, y0, x1, y1 in rects:
+            self.erasures.append(x0, y0, x1, y1)
+        self.redraw_overlay()
+        self.update_unselect_buttons()
+
+    def apply_matches(self):
+        # Whiteout every remaining match at once: one journal entry per page
+        # and a single redraw. Pending edits of the current page go first.
+        if self.erasures or self.text_annotations:
+            self.apply_erasure()
+        count = sum(len(rects) for rects in self.search_matches.values())
+        for page_index in sorted(self.search_matches):
+            self.journal.record(page_index, ("apply", tuple(self.search_matches[page_index]), ()))
+        self.status_var.set("Applied %d match(es) on %d other page(s)" % (count, len(self.search_matches)))
+        self.search_matches.clear()
+        self.apply_matches_btn.config(state=tk.DISABLED)
+        self.render_page()
+
+    def save_template(self):
+        if not self.erasures and not self.text_annotations:
+            messagebox.showinfo("Save Template", "Select the regions (and add the text) the template should contain first.")
+            return
+        name = simpledialog.askstring("Save Template", "Template name:", initialvalue=self.last_template or "",
+                                      parent=self.root)
+        if not name or not name.strip():
+            return
+        self.last_template = name.strip()
+        # The pending edits are already in PDF points, so the template works at
+        # any zoom. Clip a copy: the pending selections stay as drawn.
+        rects, texts = clip_edits(self.erasures, self.text_annotations, self.page.rect.width, self.page.rect.height)
+        try:
+            self.templates.put(self.last_template, rects, texts)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Save Template", "Could not save the template: %s" % e)
+            return
+        self.status_var.set("Saved template '%s': %d selection(s), %d text(s)" % (
+            self.last_template, len(rects), len(texts)))
+
+    def apply_template(self):
+        try:
+            names = self.templates.names()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Apply Template", "Could not read the templates: %s" % e)
+            return
+        if not names:
+            messagebox.showinfo("Apply Template", "No templates yet. Select regions on a page and click 'Save Template'.")
+            return
+        name = simpledialog.askstring("Apply Template", "Template (%s):" % ", ".join(names),
+                                      initialvalue=self.last_template if self.last_template in names else names[0],
+                                      parent=self.root)
+        if not name:
+            return
+        if name not in names:
+            messagebox.showerror("Apply Template", "No template named '%s'." % name)
+            return
+        selector = simpledialog.askstring(
+            "Apply Template", "Pages: all, ranges such as 1,3-5,8-, or a page size such as size:612x792 or size:a4",
+            initialvalue="all", parent=self.root)
+        if not selector:
+            return
+        self.stamp_template(name, selector)
+
+    @profiled("edit")
+    def stamp_template(self, name, selector):
+        # Stamp a template on many pages at once: one journal entry per page
+        # and a single redraw, like apply_matches. The clipped geometry is
+        # computed once per distinct page size and shared by those pages.
+        start = time.perf_counter()
+        if self.layout is None:
+            self.layout = PageLayout(self.doc)
+        sizes = list(zip(self.layout.widths, self.layout.heights))
+        try:
+            pages = parse_page_selector(selector, self.doc.page_count, sizes)
+        except ValueError as e:
+            messagebox.showerror("Apply Template", "Invalid pages '%s': %s" % (selector, e))
+            return
+        try:
+            rects, texts = self.templates.get(name)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            messagebox.showerror("Apply Template", "Invalid template '%s': %s" % (name, e))
+            return
+        if not pages:
+            messagebox.showinfo("Apply Template", "No pages match '%s'." % selector)
+            return
+        self.last_template = name
+        if self.erasures or self.text_annotations:
+            self.apply_erasure()
+
+        clipped = {}  # (width, height) -> (rects, texts) clipped to pages of that size
+        stamped = 0
+        for page_index in pages:
+            size = sizes[page_index]
+            if size not in clipped:
+                clipped[size] = clip_edits(rects, texts, *size)
+            page_rects, page_texts = clipped[size]
+            if not page_rects and not page_texts:
+                continue  # The template lies outside this page
+            stamped += 1
+            self.journal.record(page_index, ("apply", page_rects,
+                                             tuple((self.journal.new_key(),) + row for row in page_texts)))
+        self.render_page()
+        self.status_var.set("Applied template '%s' to %d page(s) in %.2fs" % (
+            name, stamped, time.perf_counter() - start))
+
+    def _autosave_tick(self):
+        # Periodically write a copy of the document (applied edits only) to a temp folder
+        if (self.autosave_var.get() and self.doc is not None and self.journal.version != self.autosaved_version
+                and (self.save_job is None or self.save_job.done)):
+            os.makedirs(self.autosave_dir, exist_ok=True)
+            path = os.path.join(self.autosave_dir, os.path.basename(self.doc_path) or "untitled.pdf")
+            self.autosaved_version = self.journal.version
+            self._start_save_job(path)
+        self.root.after(self.autosave_interval, self._autosave_tick)
+
+    def _bump_page_revision(self, page_index):
+        self.page_revisions[page_index] = self.page_revisions.get(page_index, 0) + 1
+        self.pixmap_cache.invalidate_page(page_index)
+
+    def _page_key(self):
+        return (self.page_index, self.scale, self.page_revisions.get(self.page_index, 0))
+
+    def _get_page_pixmap(self):
+        # Only rasterize when the page, zoom or page content changed
+        key = self._page_key()
+        pix = self.pixmap_cache.get(key)
+        if pix is None:
+            pix = self.prefetcher.take(key)
+        if pix is None:
+            pix = self.page.get_pixmap(matrix=fitz.Matrix(self.scale, self.scale))
+            self.pixmap_cache.put(key, pix)
+        return pix
+
+    @profiled("render")
+    def render_page(self, reset_view=False):
+        self._end_zoom_preview()
+        if reset_view:
+            # Reset scroll position to the top-left of the page
+            self.canvas.xview_moveto(0)
+            if self.continuous:
+                self._set_scrollregion()
+                self.canvas.yview_moveto(self.layout.tops[self.page_index] / self.layout.height)
+            else:
+                self.canvas.yview_moveto(0)
+
+        self._render_background()
+        self._draw_committed()
+        self.redraw_overlay()
+        self._trim_store()
+        if _profiler is not None:
+            self._sample_counters()
+
+    def _sample_counters(self):
+        cache = self.pixmap_cache
+        _profiler.sample("pixmap_cache", {"hits": cache.hits, "misses": cache.misses,
+                                          "megabytes": round(cache.current_bytes / 1048576, 1)})
+        _profiler.sample("rasterized", {"megabytes": round(_profiler.counters.get("rasterized_bytes", 0) / 1048576, 1)})
+        self._schedule_perf_overlay()
+
+    def _schedule_perf_overlay(self):
+        # Drawn when idle, so the render that triggered it has its duration recorded
+        if self.perf_overlay and self._perf_job is None:
+            self._perf_job = self.root.after_idle(self._draw_perf_overlay)
+
+    def toggle_perf_overlay(self):
+        self.perf_overlay = not self.perf_overlay
+        if self.perf_overlay:
+            enable_profiling()
+            self._draw_perf_overlay()
+        else:
+            self.canvas.delete("perf")
+            # Profiling stays on only when a trace was asked for with --profile
+            if not self.profile_path:
+                disable_profiling()
+
+    def _draw_perf_overlay(self):
+        self._perf_job = None
+        if not self.perf_overlay or _profiler is None:
+            return
+        last = _profiler.last
+        cache = self.pixmap_cache
+        text = "frame %.1f ms   tiles %.1f ms\ncache %d hits / %d misses\n%.1f MB rasterized" % (
+            last.get("render_page", 0) * 1000, last.get("_render_visible_tiles", 0) * 1000,
+            cache.hits, cache.misses, _profiler.counters.get("rasterized_bytes", 0) / 1048576)
+        x, y = self.canvas.canvasx(4), self.canvas.canvasy(4)
+        items = self.canvas.find_withtag("perf")
+        if items:
+            self.canvas.coords(items[0], x, y)
+            self.canvas.itemconfig(items[0], text=text)
+        else:
+            self.canvas.create_text(x, y, text=text, anchor="nw", fill="yellow", font=("Courier", 9),
+                                    tags="perf")
+        self.canvas.tag_raise("perf")
+
+    def _pixmap_to_photo(self, pix):
+        return ImageTk.PhotoImage(_pixmap_to_image(pix))
+
+    def _render_background(self):
+        # The page bitmap is a single persistent canvas image (or a set of
+        # viewport tiles at high zoom) that is only swapped out when the page,
+        # zoom or page content actually changed
+        if self.background_key == self._page_key():
+            return
+        self.background_key = self._page_key()
+
+        width = math.ceil(self.page.rect.width * self.scale)
+        height = math.ceil(self.page.rect.height * self.scale)
+        # The continuous view is always tiled, so only what is in view is rendered
+        self.tiled = self.continuous or width * height > self.tile_min_pixels
+        self._clear_tiles()
+
+        if self.tiled:
+            if self.image_id is not None:
+                self.canvas.delete(self.image_id)
+                self.image_id = None
+                self.tk_img = None
+            self._set_scrollregion()
+            self._render_visible_tiles()
+            return
+
+        pix = self._get_page_pixmap()
+        self.tk_img = self._pixmap_to_photo(pix)
+
+        if self.image_id is None:
+            self.image_id = self.canvas.create_image(0, 0, image=self.tk_img, anchor="nw", tags="page")
+        else:
+            self.canvas.itemconfig(self.image_id, image=self.tk_img)
+        self.canvas.tag_lower(self.image_id)
+
+        self._set_scrollregion()
+
+        # Warm the cache for the neighbouring pages at the new page/zoom
+        self.prefetcher.schedule(self.page_index, self.scale, self.doc.page_count, self.page_revisions)
+
+    def _schedule_tile_update(self):
+        # Coalesce scroll and resize events into one tile pass per idle cycle
+        if self.tiled and self._tile_job is None and self._zoom_job is None:
+            self._tile_job = self.root.after_idle(self._render_visible_tiles)
+
+    @profiled("render")
+    def _render_visible_tiles(self):
+        self._tile_job = None
+        if not self.tiled or self.page is None:
+            return
+
+        size = self.tile_size
+        left = int(self.canvas.canvasx(0))
+        top = int(self.canvas.canvasy(0))
+        right = int(self.canvas.canvasx(self.canvas.winfo_width())) - 1
+        bottom = int(self.canvas.canvasy(self.canvas.winfo_height())) - 1
+        if self.continuous:
+            # The pages in view plus half a screen above and below
+            margin = self.canvas.winfo_height() // 2
+            top, bottom = top - margin, bottom + margin
+            origin = self.layout.tops[self.page_index]
+            pages = self.layout.pages_between(origin + top / self.scale, origin + bottom / self.scale)
+        else:
+            pages = (self.page_index,)
+
+        visible = set()
+        for i in pages:
+            if i == self.page_index:
+                width, height = self.page.rect.width, self.page.rect.height
+            else:
+                width, height = self.layout.widths[i], self.layout.heights[i]
+            offset = int(self._page_offset(i))
+            x0, x1 = max(0, left), min(math.ceil(width * self.scale) - 1, right)
+            y0, y1 = max(0, top - offset), min(math.ceil(height * self.scale) - 1, bottom - offset)
+            if x1 < x0 or y1 < y0:
+                continue
+            visible.update((i, col, row)
+                           for col in range(x0 // size, x1 // size + 1)
+                           for row in range(y0 // size, y1 // size + 1))
+
+        # Release the tiles that scrolled out of view; their pixmaps stay cached
+        for tile in [t for t in self.tile_items if t not in visible]:
+            self.canvas.delete(self.tile_items.pop(tile)[0])
+
+        # The tiles missing from the cache are rendered in one pass per page
+        added = sorted(visible - self.tile_items.keys())
+        missing = {}
+        for i, col, row in added:
+            if (i, self.scale, self.page_revisions.get(i, 0), col, row) not in self.pixmap_cache:
+                missing.setdefault(i, []).append((col, row))
+        rendered = {}
+        for i, tiles in missing.items():
+            page = self.page if i == self.page_index else self.doc[i]
+            for (col, row), pix in render_tiles(page, self.scale, tiles, size).items():
+                key = (i, self.scale, self.page_revisions.get(i, 0), col, row)
+                self.pixmap_cache.put(key, pix)
+                rendered[key] = pix
+
+        for i, col, row in added:
+            key = (i, self.scale, self.page_revisions.get(i, 0), col, row)
+            pix = rendered.get(key)
+            if pix is None:
+                pix = self.pixmap_cache.get(key)
+            photo = self._pixmap_to_photo(pix)
+            item = self.canvas.create_image(pix.x, pix.y + self._page_offset(i), image=photo,
+                                            anchor="nw", tags="page")
+            self.tile_items[(i, col, row)] = (item, photo)
+        self.canvas.tag_lower("page")
+        self._trim_store()
+
+        if self.continuous:
+            # Applied edits are shown on every page that has tiles
+            self.visible_pages = tuple(sorted({i for i, _, _ in self.tile_items}))
+            self._draw_committed()
+
+    def _page_offset(self, page_index):
+        # Canvas y of a page's top edge. The current page always sits at the
+        # canvas origin, so editing works in the same coordinates in both views.
+        if page_index == self.page_index:
+            return 0
+        return (self.layout.tops[page_index] - self.layout.tops[self.page_index]) * self.scale
+
+    def _set_scrollregion(self):
+        s = self.scale
+        if self.continuous:
+            top = -self.layout.tops[self.page_index] * s
+            region = (0, top, math.ceil(self.layout.width * s), top + math.ceil(self.layout.height * s))
+        else:
+            region = (0, 0, math.ceil(self.page.rect.width * s), math.ceil(self.page.rect.height * s))
+        self.canvas.config(scrollregion=region)
+        return region
+
+    def toggle_continuous(self):
+        self.continuous = self.continuous_var.get()
+        if not self.continuous:
+            self.visible_pages = ()
+        if not self.doc:
+            return
+        if self.continuous and self.layout is None:
+            self.layout = PageLayout(self.doc)
+        self.background_key = None
+        self.render_page(reset_view=True)
+
+    def _focus_page_at(self, event):
+        # In the continuous view an edit goes to the page under the cursor,
+        # which then becomes the current page. The canvas is shifted so the
+        # new page sits at the origin; the view itself does not move.
+        if not self.continuous or not self.doc:
+            return
+        y = self.layout.tops[self.page_index] + self.canvas.canvasy(event.y) / self.scale
+        page_index = self.layout.page_at(y)
+        if page_index == self.page_index:
+            return
+        if self.erasures or self.text_annotations:
+            self.apply_erasure()
+
+        dy = self._page_offset(page_index)
+        top = self.canvas.canvasy(0)
+        self.canvas.move("all", 0, -dy)
+        self.page_index = page_index
+        self.page = self.doc[page_index]
+        x0, y0, x1, y1 = self._set_scrollregion()
+        self.canvas.yview_moveto((top - dy - y0) / (y1 - y0))
+        self.background_key = self._page_key()
+        self._draw_committed()
+        self._show_matches()
+        self.update_nav_buttons()
+        self.update_unselect_buttons()
+        self._highlight_thumbnail(scroll=True)
+
+    def _clear_tiles(self):
+        for item, _ in self.tile_items.values():
+            self.canvas.delete(item)
+        self.tile_items.clear()
+
+    def _draw_committed(self):
+        # The applied edits of the page (white fills and text), composited
+        # from the journal as canvas items above the page bitmap. A zoom
+        # alone rescales the existing items instead of drawing them again.
+        key = (self.page_index, self.journal.version, self.visible_pages)
+        if key == self._committed_key:
+            if self.committed_scale != self.scale:
+                self._rescale_committed()
+            return
+        self._committed_key = key
+        self.committed_scale = self.scale
+
+        self.canvas.delete("committed")
+        self.committed_items.clear()
+        self.committed_index.clear()
+        del self._committed_texts[:]
+        s = self.scale
+        # The other pages of the continuous view too; only the current page's text can be picked
+        for page_index in (self.page_index,) + tuple(i for i in self.visible_pages if i != self.page_index):
+            dy = self._page_offset(page_index)
+            rects, texts = self.journal.state(page_index)
+            for x0, y0, x1, y1 in rects:
+                self.canvas.create_rectangle(x0 * s, y0 * s + dy, x1 * s, y1 * s + dy, fill="white",
+                                             outline="white", width=s, tags=("committed", "committed_fill"))
+            for text_key, (x, y, text, font_size) in texts.items():
+                tx, ty = self._committed_text_pos(x, y, font_size)
+                item = self.canvas.create_text(tx, ty + dy, text=text, fill="black", anchor="sw",
+                                               font=self._committed_font(font_size), tags="committed")
+                if page_index != self.page_index:
+                    text_key = None
+                else:
+                    self.committed_items[text_key] = item
+                    self.committed_index.insert(text_key, self._committed_text_bbox(x, y, text, font_size))
+                self._committed_texts.append((item, page_index, text_key, x, y, text, font_size))
+        self.canvas.tag_raise("overlay")
+
+        self.undo_btn.config(state=tk.NORMAL if self.journal.can_undo(self.page_index) else tk.DISABLED)
+        self.redo_btn.config(state=tk.NORMAL if self.journal.can_redo(self.page_index) else tk.DISABLED)
+
+    def _rescale_committed(self):
+        # The fills follow one canvas transform, like the overlay; text only
+        # needs its font size and baseline updated
+        factor = self.scale / self.committed_scale
+        self.canvas.scale("committed", 0, 0, factor, factor)
+        self.canvas.itemconfig("committed_fill", width=self.scale)
+        self.committed_scale = self.scale
+        self.committed_index.clear()
+        for item, page_index, text_key, x, y, text, font_size in self._committed_texts:
+            tx, ty = self._committed_text_pos(x, y, font_size)
+            self.canvas.coords(item, tx, ty + self._page_offset(page_index))
+            self.canvas.itemconfig(item, font=self._committed_font(font_size))
+            if text_key is not None:
+                self.committed_index.insert(text_key, self._committed_text_bbox(x, y, text, font_size))
+
+    def _committed_font(self, font_size):
+        # Applied text is previewed at its real size on the page: negative Tk sizes are pixels
+        return ("Helvetica", -max(1, int(round(font_size * self.scale))))
+
+    def _committed_text_pos(self, x, y, font_size):
+        # insert_text anchors at the baseline; Tk's "sw" anchor is the bottom of the descent
+        font = self._committed_font(font_size)
+        descent = self._descents.get(font)
+        if descent is None:
+            descent = self._descents[font] = self._font(font).metrics("descent")
+        return x * self.scale, y * self.scale + descent
+
+    def _committed_text_bbox(self, x, y, text, font_size):
+        # Canvas bbox of an applied text (x, y in PDF points), from cached font metrics
+        tx, ty = self._committed_text_pos(x, y, font_size)
+        width, height = self._text_size(text, self._committed_font(font_size))
+        return (tx, ty - height, tx + width, ty)
+
+    def _committed_text_at(self, x, y):
+        # Journal key of the topmost applied text under (x, y), or None
+        hits = self.committed_index.query_point(x, y)
+        return max(hits) if hits else None
+
+    def redraw_overlay(self):
+        # Overlay items are drawn at screen = pdf * scale. A zoom change is
+        # applied to all of them at once as a single canvas transform.
+        if self.overlay_scale != self.scale:
+            factor = self.scale / self.overlay_scale
+            self.canvas.scale("overlay", 0, 0, factor, factor)
+            self.overlay_scale = self.scale
+
+        # Create the selection rectangles (red outlines) that are not on the canvas yet
+        rects = self.erasures.scaled(self.scale)
+        for x0, y0, x1, y1 in rects[len(self.selection_rects):]:
+            r = self.canvas.create_rectangle(x0, y0, x1, y1, outline="red", width=2, tags="overlay")
+            self.selection_rects.append(r)
+        while len(self.selection_rects) > len(self.erasures):
+            self.canvas.delete(self.selection_rects.pop())
+
+        # Create the text items that are not on the canvas yet
+        texts = self.text_annotations
+        for i, text_id in enumerate(texts.items):
+            if text_id is None:
+                texts.set_item(i, self.canvas.create_text(
+                    texts.x[i] * self.scale, texts.y[i] * self.scale, text=texts.text[i], fill="black",
+                    anchor="nw", font=self._tk_font(texts.font_size[i]), tags="overlay"))
+                self._index_text(i)
+
+    def _update_text(self, index, x, y, font_size=None):
+        # Update one annotation (x, y in screen pixels) and its canvas item
+        # without touching the rest of the page
+        texts = self.text_annotations
+        text_id = texts.items[index]
+        self.canvas.coords(text_id, x, y)
+        texts.move(index, x / self.scale, y / self.scale)
+        if font_size is not None and font_size != texts.font_size[index]:
+            self.canvas.itemconfig(text_id, font=self._tk_font(font_size))
+            texts.resize(index, font_size)
+        self._index_text(index)
+
+    def _tk_font(self, font_size):
+        # Tk font sizes are whole points
+        return ("Arial", int(round(font_size)))
+
+    def _font(self, font):
+        # tkfont.Font for measuring a Tk font description
+        measure = self._fonts.get(font)
+        if measure is None:
+            measure = self._fonts[font] = tkfont.Font(family=font[0], size=font[1])
+        return measure
+
+    def _text_size(self, text, font):
+        # (width, height) in pixels of text in a Tk font, from cached font
+        # metrics instead of a round-trip through a temporary canvas item
+        size = self._text_sizes.get((text, font))
+        if size is None:
+            measure = self._font(font)
+            lines = text.split("\n")
+            size = (max(measure.measure(line) for line in lines), measure.metrics("linespace") * len(lines))
+            self._text_sizes[(text, font)] = size
+        return size
+
+    def _text_bbox(self, x, y, text, font_size):
+        # Canvas bbox of an anchor="nw" text item
+        width, height = self._text_size(text, self._tk_font(font_size))
+        return (x, y, x + width, y + height)
+
+    def _index_text(self, index):
+        # Keep one annotation's bbox in the hit-test index; skipped while the
+        # index is stale after a zoom, as it is rebuilt before the next query
+        if self._text_index_scale != self.scale:
+            return
+        texts = self.text_annotations
+        self.text_index.insert(texts.items[index], self._text_bbox(
+            texts.x[index] * self.scale, texts.y[index] * self.scale, texts.text[index], texts.font_size[index]))
+
+    def _text_at(self, x, y):
+        # Index of the first text annotation under (x, y) in screen pixels, or -1
+        texts = self.text_annotations
+        if self._text_index_scale != self.scale:
+            self.text_index.clear()
+            self._text_index_scale = self.scale
+            for i in range(len(texts)):
+                if texts.items[i] is not None:
+                    self._index_text(i)
+
+        rows = [texts.rows[text_id] for text_id in self.text_index.query_point(x, y) if text_id in texts.rows]
+        return min(rows) if rows else -1
+
+    def clear_text_annotations(self):
+        for text_id in self.text_annotations.items:
+            self.canvas.delete(text_id)
+        self.text_annotations.clear()
+        self.text_index.clear()
 
     def clear_selection_rects(self):
         for r in self.selection_rects:
@@ -372,33 +2646,109 @@ class PDFEditorApp:
 
     def prev_page(self):
         if self.doc and self.page_index > 0:
-            # Apply current changes before moving
-            if self.erasures or self.text_annotations:
-                self.apply_erasure()
-            
-            self.page_index -= 1
-            self.page = self.doc[self.page_index]
-            self.erasures.clear()
-            self.text_annotations.clear()
-            self.clear_selection_rects()
-            self.render_page()
-            self.update_nav_buttons()
-            self.update_unselect_buttons()
+            self.go_to_page(self.page_index - 1)
 
     def next_page(self):
         if self.doc and self.page_index < self.doc.page_count - 1:
-            # Apply current changes before moving
-            if self.erasures or self.text_annotations:
-                self.apply_erasure()
-            
-            self.page_index += 1
-            self.page = self.doc[self.page_index]
-            self.erasures.clear()
-            self.text_annotations.clear()
-            self.clear_selection_rects()
-            self.render_page()
-            self.update_nav_buttons()
-            self.update_unselect_buttons()
+            self.go_to_page(self.page_index + 1)
+
+    @profiled("navigate")
+    def go_to_page(self, page_index):
+        if not self.doc or page_index == self.page_index or not 0 <= page_index < self.doc.page_count:
+            return
+        # Apply current changes before moving
+        if self.erasures or self.text_annotations:
+            self.apply_erasure()
+
+        self.page_index = page_index
+        self.page = self.doc[self.page_index]
+        self.erasures.clear()
+        self.clear_text_annotations()
+        self.clear_selection_rects()
+        self.render_page(reset_view=True)
+        self._show_matches()
+        self.update_nav_buttons()
+        self.update_unselect_buttons()
+        self._highlight_thumbnail(scroll=True)
+
+    def _layout_thumbnails(self):
+        # Every entry gets the same slot, so the sidebar is laid out without
+        # touching any page but the first; images are only made for the slots
+        # scrolled into view
+        self.thumb_canvas.delete("all")
+        self.thumb_items.clear()
+        self.thumb_images.clear()
+        rect = self.doc[0].rect
+        self.thumb_slot = int(self.thumb_width * rect.height / rect.width) + 2 * self.thumb_pad + 14
+        self.thumb_canvas.config(scrollregion=(0, 0, self.thumb_width + 2 * self.thumb_pad,
+                                               self.thumb_slot * self.doc.page_count))
+        self.thumb_canvas.yview_moveto(0)
+        self._highlight_thumbnail()
+        self._schedule_thumbnail_update()
+
+    def _schedule_thumbnail_update(self):
+        # Coalesce scroll and resize events into one pass per idle cycle
+        if self._thumb_job is None:
+            self._thumb_job = self.root.after_idle(self._update_thumbnails)
+
+    def _update_thumbnails(self):
+        self._thumb_job = None
+        if not self.doc or not self.thumb_slot:
+            return
+        top = self.thumb_canvas.canvasy(0)
+        bottom = self.thumb_canvas.canvasy(self.thumb_canvas.winfo_height())
+        # Keep a couple of entries beyond each edge so short scrolls find them ready
+        first = max(0, int(top // self.thumb_slot) - 2)
+        last = min(self.doc.page_count - 1, int(bottom // self.thumb_slot) + 2)
+        keep = range(first, last + 1)
+
+        for page_index in [i for i in self.thumb_items if i not in keep]:
+            for item in self.thumb_items.pop(page_index):
+                self.thumb_canvas.delete(item)
+            self.thumb_images.pop(page_index, None)
+        self.thumbnails.discard(keep)
+
+        for page_index in keep:
+            if page_index in self.thumb_items:
+                continue
+            y = page_index * self.thumb_slot
+            self.thumb_items[page_index] = [
+                self.thumb_canvas.create_text(self.thumb_pad + self.thumb_width / 2, y + self.thumb_slot - self.thumb_pad,
+                                              text=str(page_index + 1), fill="white", anchor="s"),
+            ]
+            self.thumbnails.request(page_index)
+        self.thumb_canvas.tag_raise("thumb_current")
+
+    def _on_thumbnail_ready(self, page_index, data):
+        if page_index not in self.thumb_items:
+            return  # Scrolled out of view meanwhile
+        photo = tk.PhotoImage(data=data)
+        item = self.thumb_canvas.create_image(self.thumb_pad + self.thumb_width / 2,
+                                              page_index * self.thumb_slot + self.thumb_pad,
+                                              image=photo, anchor="n")
+        self.thumb_items[page_index].append(item)
+        self.thumb_images[page_index] = photo
+        self.thumb_canvas.tag_raise("thumb_current")
+
+    def _highlight_thumbnail(self, scroll=False):
+        self.thumb_canvas.delete("thumb_current")
+        if not self.thumb_slot:
+            return
+        y = self.page_index * self.thumb_slot
+        self.thumb_canvas.create_rectangle(2, y + 2, self.thumb_width + 2 * self.thumb_pad - 2, y + self.thumb_slot - 2,
+                                           outline="orange", width=2, tags="thumb_current")
+        if scroll:
+            # Bring the current page's entry into view when it is off screen
+            top = self.thumb_canvas.canvasy(0)
+            bottom = self.thumb_canvas.canvasy(self.thumb_canvas.winfo_height())
+            if y < top or y + self.thumb_slot > bottom:
+                self.thumb_canvas.yview_moveto(y / (self.thumb_slot * self.doc.page_count))
+
+    def on_thumbnail_click(self, event):
+        if not self.doc or not self.thumb_slot:
+            return
+        page_index = int(self.thumb_canvas.canvasy(event.y) // self.thumb_slot)
+        self.go_to_page(page_index)
 
     def update_nav_buttons(self):
         self.prev_btn.config(state=tk.NORMAL if self.page_index > 0 else tk.DISABLED)
@@ -414,21 +2764,88 @@ class PDFEditorApp:
                         if isinstance(b, tk.Button) and b.cget("text") == btn_text:
                             b.config(state=state)
 
-    def load_pdf(self):
-        path = filedialog.askopenfilename(filetypes=[("PDF Files", "*.pdf")])
+    @profiled("io")
+    def load_pdf(self, path=None):
+        if self.loader is not None and not self.loader.done:
+            return
+        if not path:
+            path = filedialog.askopenfilename(filetypes=[("PDF Files", "*.pdf")])
         if not path:
             return
-        self.doc = fitz.open(path)
+        # Opening and the first render happen on a worker thread. The
+        # continuous view always draws tiles, so it skips the first render.
+        self.status_var.set("Opening %s..." % os.path.basename(path))
+        self.loader = DocumentLoader(path, self.default_scale, in_memory=self.load_in_memory,
+                                     max_pixels=0 if self.continuous else self.tile_min_pixels).start()
+        self.root.after(50, self._poll_loader)
+
+    def _poll_loader(self):
+        loader = self.loader
+        if not loader.done:
+            self.status_var.set("Opening %s (%.1fs)..." % (
+                os.path.basename(loader.path), time.perf_counter() - loader._start))
+            self.root.after(100, self._poll_loader)
+            return
+        if loader.error:
+            self.status_var.set("Could not open %s" % os.path.basename(loader.path))
+            messagebox.showerror("Open Error", loader.error)
+            return
+
+        self._open_document(loader)
+        rss = _resident_memory()
+        self.status_var.set("Opened %s: %d page(s)%s, first page shown after %.2fs%s" % (
+            os.path.basename(loader.path), self.doc.page_count,
+            " (repaired)" if loader.repaired_copy or self.doc.is_repaired else "",
+            time.perf_counter() - loader._start,
+            ", %s resident" % _format_size(rss) if rss is not None else ""))
+
+    def _remove_repaired_copy(self):
+        if self.doc_source is not None and self.doc_source != self.doc_path:
+            try:
+                os.remove(self.doc_source)
+            except OSError:
+                pass  # Still open in a worker on some platforms; it is in the temp dir anyway
+        self.doc_source = None
+
+    @profiled("io")
+    def _open_document(self, loader):
+        if self.doc is not None:
+            self.doc.close()
+        self._remove_repaired_copy()
+        self.doc = loader.doc
+        self.doc_path = loader.path
+        self.doc_source = loader.repaired_copy or loader.path
+        self._mapping = loader.mapping
+        self.prefetcher.set_document(self.doc_source)
+        self.thumbnails.set_document(self.doc_source, self._on_thumbnail_ready)
+        self.layout = PageLayout(self.doc) if self.continuous else None
+        if self.search_job is not None:
+            self.search_job.cancel()
+        self.search_matches.clear()
+        self.apply_matches_btn.config(state=tk.DISABLED)
+        self.visible_pages = ()
+        self.pixmap_cache.clear()
+        if loader.first_pixmap is not None:
+            self.pixmap_cache.put((0, self.default_scale, 0), loader.first_pixmap)
+        self.page_revisions.clear()
+        self.journal.clear()
+        self._incremental_hold = None
+        self.autosaved_version = self.journal.version
+        self._committed_key = None
         self.page_index = 0
         self.page = self.doc[self.page_index]
         self.erasures.clear()
-        self.text_annotations.clear()
+        self.clear_text_annotations()
         self.clear_selection_rects()
+        self.background_key = None
 
         self.apply_btn.config(state=tk.NORMAL)
         self.save_btn.config(state=tk.NORMAL)
         self.text_btn.config(state=tk.NORMAL, relief=tk.RAISED)
         self.remove_text_btn.config(state=tk.NORMAL, relief=tk.RAISED)
+        self.find_btn.config(state=tk.NORMAL)
+        self.save_template_btn.config(state=tk.NORMAL)
+        self.apply_template_btn.config(state=tk.NORMAL)
         self.prev_btn.config(state=tk.DISABLED)
         self.next_btn.config(state=tk.NORMAL if self.doc.page_count > 1 else tk.DISABLED)
         self.update_unselect_buttons()
@@ -437,50 +2854,113 @@ class PDFEditorApp:
         self.text_mode = False
         self.remove_text_mode = False
         self.font_size_combo.config(state="disabled")
-        self.scale = 2.0  # Reset to default scale
+        self.scale = self.default_scale
 
-        self.render_page()
+        self.render_page(reset_view=True)
+        self._layout_thumbnails()
+
+    def _trim_store(self):
+        # MuPDF keeps fonts, images and display lists cached up to its own
+        # limit; shrink it back under store_limit so long sessions level off
+        size = _mupdf_store_size()
+        if self.store_limit and size is not None and size > self.store_limit:
+            fitz.TOOLS.store_shrink(math.ceil(100 * (1 - self.store_limit / size)))
 
     def zoom_in(self):
-        if self.scale + self.scale_step <= self.max_scale:
-            old_scale = self.scale
-            self.scale += self.scale_step
-            self._scale_coordinates(old_scale)
-            self.render_page()
+        self._zoom_to(self.scale + self.scale_step)
 
     def zoom_out(self):
-        if self.scale - self.scale_step >= self.min_scale:
-            old_scale = self.scale
-            self.scale -= self.scale_step
-            self._scale_coordinates(old_scale)
-            self.render_page()
-
-    def _scale_coordinates(self, old_scale):
-        # Scale text annotations
-        scaled_annotations = []
-        for x, y, text, _, font_size in self.text_annotations:
-            # Scale coordinates based on the ratio of new scale to old scale
-            new_x = x * (self.scale / old_scale)
-            new_y = y * (self.scale / old_scale)
-            scaled_annotations.append((new_x, new_y, text, None, font_size))
-        self.text_annotations = scaled_annotations
-
-        # Scale erasures
-        scaled_erasures = []
-        for x0, y0, x1, y1 in self.erasures:
-            # Scale coordinates based on the ratio of new scale to old scale
-            new_x0 = x0 * (self.scale / old_scale)
-            new_y0 = y0 * (self.scale / old_scale)
-            new_x1 = x1 * (self.scale / old_scale)
-            new_y1 = y1 * (self.scale / old_scale)
-            scaled_erasures.append((new_x0, new_y0, new_x1, new_y1))
-        self.erasures = scaled_erasures
+        self._zoom_to(self.scale - self.scale_step)
 
+    @profiled("input")
     def on_mousewheel(self, event):
+        if self.continuous and not event.state & 0x4:
+            # The continuous view scrolls with the wheel and zooms with Ctrl+wheel
+            self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units")
+            return
         if event.delta > 0:
-            self.zoom_in()
+            self._zoom_to(self.scale + self.scale_step, event.x, event.y)
+        else:
+            self._zoom_to(self.scale - self.scale_step, event.x, event.y)
+
+    @profiled("render")
+    def _zoom_to(self, scale, x=None, y=None):
+        # Every zoom step only resamples the bitmap already on screen; MuPDF
+        # renders once the zoom has not changed for zoom_settle_ms
+        scale = min(self.max_scale, max(self.min_scale, scale))
+        if not self.doc or scale == self.scale:
+            return
+        if x is None:
+            x, y = self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2
+
+        # Page point under the cursor (or the view centre), kept in place
+        px = self.canvas.canvasx(x) / self.scale
+        py = self.canvas.canvasy(y) / self.scale
+        if self._zoom_job is None:
+            self.canvas.itemconfig("page", state="hidden")
+        else:
+            self.root.after_cancel(self._zoom_job)
+        self._zoom_job = self.root.after(self.zoom_settle_ms, self.render_page)
+
+        self.scale = scale
+        x0, y0, x1, y1 = self._set_scrollregion()
+        self.canvas.xview_moveto((px * scale - x - x0) / (x1 - x0))
+        self.canvas.yview_moveto((py * scale - y - y0) / (y1 - y0))
+
+        self._show_zoom_preview()
+        self._draw_committed()
+        self.redraw_overlay()
+
+    def _show_zoom_preview(self):
+        # Resample just the part of the page that is in view
+        base_scale, image = self._preview_image()
+        left = max(0, int(self.canvas.canvasx(0)))
+        top = max(0, int(self.canvas.canvasy(0)))
+        right = min(math.ceil(self.page.rect.width * self.scale),
+                    int(self.canvas.canvasx(self.canvas.winfo_width())))
+        bottom = min(math.ceil(self.page.rect.height * self.scale),
+                     int(self.canvas.canvasy(self.canvas.winfo_height())))
+        if right <= left or bottom <= top:
+            return
+        f = base_scale / self.scale
+        preview = image.resize((right - left, bottom - top), Image.BILINEAR,
+                               box=(left * f, top * f, right * f, bottom * f))
+        self._preview_photo = ImageTk.PhotoImage(preview)
+        if self._preview_item is None:
+            self._preview_item = self.canvas.create_image(left, top, image=self._preview_photo,
+                                                          anchor="nw", tags="preview")
         else:
-            self.zoom_out()
+            self.canvas.coords(self._preview_item, left, top)
+            self.canvas.itemconfig(self._preview_item, image=self._preview_photo)
+        self.canvas.tag_lower(self._preview_item)
+
+    def _preview_image(self):
+        # The crisp render the gesture started from, or for tiled pages one
+        # smaller render of the whole page; converted once per gesture
+        if self._preview_base is None:
+            if self.tiled:
+                area = self.page.rect.width * self.page.rect.height
+                scale = math.sqrt(self.tile_min_pixels / 4 / area)
+            else:
+                scale = self.background_key[1]
+            key = (self.page_index, scale, self.page_revisions.get(self.page_index, 0))
+            pix = self.pixmap_cache.get(key)
+            if pix is None:
+                pix = self.page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+                self.pixmap_cache.put(key, pix)
+            self._preview_base = (scale, Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+        return self._preview_base
+
+    def _end_zoom_preview(self):
+        if self._zoom_job is None:
+            return
+        self.root.after_cancel(self._zoom_job)
+        self._zoom_job = None
+        if self._preview_item is not None:
+            self.canvas.delete(self._preview_item)
+        self._preview_item = self._preview_photo = self._preview_base = None
+        self.canvas.itemconfig("page", state="normal")
+        self._schedule_tile_update()
 
     def apply_erasure_event(self, event):
         self.apply_erasure()
@@ -505,32 +2985,48 @@ class PDFEditorApp:
 
     def unselect_all(self):
         self.erasures.clear()
-        self.text_annotations.clear()
+        self.clear_text_annotations()
         self.clear_selection_rects()
         self.update_unselect_buttons()
 
+    @profiled("input")
     def on_right_start(self, event):
+        self._focus_page_at(event)
         if self.text_mode:
             x = self.canvas.canvasx(event.x)
             y = self.canvas.canvasy(event.y)
             
             # Check if clicked on existing text
-            for i, (tx, ty, text, _, font_size) in enumerate(self.text_annotations):
-                # Create a temporary text item to get its bbox
-                temp_text = self.canvas.create_text(tx, ty, text=text, anchor="nw", font=("Arial", font_size))
-                bbox = self.canvas.bbox(temp_text)
-                self.canvas.delete(temp_text)
-                
-                if bbox and x >= bbox[0] and x <= bbox[2] and y >= bbox[1] and y <= bbox[3]:
-                    # Start dragging the text
-                    self.dragging_text = True
-                    self.selected_text_index = i
-                    self.drag_start_x = x - tx
-                    self.drag_start_y = y - ty
-                    self.canvas.config(cursor="fleur")  # Change cursor to indicate dragging
-                    return
-
+            i = self._text_at(x, y)
+            if i >= 0:
+                tx, ty = self.text_annotations.x[i] * self.scale, self.text_annotations.y[i] * self.scale
+                # Start dragging the text
+                self.dragging_text = True
+                self.selected_text_index = i
+                self.drag_start_x = x - tx
+                self.drag_start_y = y - ty
+                self.canvas.config(cursor="fleur")  # Change cursor to indicate dragging
+                return
+
+            text_key = self._committed_text_at(x, y)
+            if text_key is not None:
+                # Applied text: move its canvas item while dragging, journal the move on release
+                self.dragging_text = True
+                self.selected_committed_key = text_key
+                ix, iy = self.canvas.coords(self.committed_items[text_key])
+                self.drag_start_x = x - ix
+                self.drag_start_y = y - iy
+                self.canvas.config(cursor="fleur")
+
+    @profiled("input")
     def on_right_drag(self, event):
+        if self.text_mode and self.dragging_text and self.selected_committed_key is not None:
+            x = self.canvas.canvasx(event.x)
+            y = self.canvas.canvasy(event.y)
+            self.canvas.coords(self.committed_items[self.selected_committed_key],
+                               x - self.drag_start_x, y - self.drag_start_y)
+            return
+
         if self.text_mode and self.dragging_text and self.selected_text_index >= 0:
             x = self.canvas.canvasx(event.x)
             y = self.canvas.canvasy(event.y)
@@ -539,20 +3035,728 @@ class PDFEditorApp:
             new_x = x - self.drag_start_x
             new_y = y - self.drag_start_y
             
-            # Update the text position in the annotations list
-            x, y, text, _, font_size = self.text_annotations[self.selected_text_index]
-            self.text_annotations[self.selected_text_index] = (new_x, new_y, text, _, font_size)
-            
-            # Redraw the page to show the new position
-            self.render_page()
+            # Move the existing canvas item in place
+            self._update_text(self.selected_text_index, new_x, new_y)
 
+    @profiled("input")
     def on_right_release(self, event):
         if self.text_mode and self.dragging_text:
+            text_key = self.selected_committed_key
+            if text_key is not None:
+                x, y, _, font_size = self.journal.state(self.page_index)[1][text_key]
+                ix, iy = self.canvas.coords(self.committed_items[text_key])
+                old_x, old_y = self._committed_text_pos(x, y, font_size)
+                if (ix, iy) != (old_x, old_y):
+                    self.journal.record(self.page_index, ("move", text_key, x + (ix - old_x) / self.scale,
+                                                          y + (iy - old_y) / self.scale))
+                    self.render_page()
             self.dragging_text = False
             self.selected_text_index = -1
+            self.selected_committed_key = None
             self.canvas.config(cursor="crosshair")
 
-if __name__ == "__main__":
+
+def parse_page_selector(selector, page_count, page_sizes=None):
+    # Turn "all", "last", "3", "2-5", "4-", "size:WxH" or a comma separated mix
+    # of those (1-based, inclusive) into a sorted list of 0-based page indices.
+    # "size:" takes the page size in points ("size:612x792") or a paper name
+    # ("size:a4") and selects the pages of that size, as displayed, within a
+    # point; page_sizes gives the (width, height) of every page for it.
+    pages = set()
+    for kind, first, last in _selector_parts(selector):
+        if kind == "size":
+            if page_sizes is None:
+                raise ValueError("Page sizes are needed to select pages by size")
+            pages.update(i for i in range(page_count) if abs(page_sizes[i][0] - first) <= 1
+                         and abs(page_sizes[i][1] - last) <= 1)
+        elif kind == "last":
+            pages.update(range(max(page_count - 1, 0), page_count))
+        else:
+            # An open end, or one past the last page, just stops at the last page
+            pages.update(range(first - 1, page_count if last is None else min(last, page_count)))
+    return sorted(pages)
+
+
+def _selector_parts(selector):
+    # The parts of a page selector as ("pages", first, last or None for an open
+    # end), ("last", None, None) or ("size", width, height). Raises ValueError
+    # for malformed parts, whatever the document, so specs can be checked
+    # before any file is opened.
+    if selector is None or str(selector).strip().lower() in ("", "all"):
+        return [("pages", 1, None)]
+    parts = []
+    for part in str(selector).split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if part.startswith("size:"):
+            parts.append(("size",) + _parse_page_size(part[5:]))
+            continue
+        if part == "last":
+            parts.append(("last", None, None))
+            continue
+        try:
+            if "-" in part:
+                start, _, end = part.partition("-")
+                first = int(start) if start.strip() else 1
+                last = int(end) if end.strip() else None
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError("Invalid page selector: %r" % part) from None
+        if first < 1 or (last is not None and last < first):
+            raise ValueError("Invalid page selector: %r" % part)
+        parts.append(("pages", first, last))
+    return parts
+
+
+def _parse_page_size(size):
+    width, sep, height = size.strip().partition("x")
+    if sep:
+        try:
+            return float(width), float(height)
+        except ValueError:
+            raise ValueError("Invalid page size: %r" % size) from None
+    width, height = fitz.paper_size(size.strip())
+    if width < 0:
+        raise ValueError("Unknown page size: %r" % size)
+    return float(width), float(height)
+
+
+def selector_page_sizes(doc, selectors):
+    # (width, height) of every page of doc if any selector selects by size, else None
+    if not any("size:" in str(selector).lower() for selector in selectors):
+        return None
+    return [(page.rect.width, page.rect.height) for page in doc]
+
+
+def load_edit_spec(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_edit_spec(json.load(f))
+
+
+def parse_edit_spec(raw):
+    # Validate a batch edit spec:
+    # {"erasures": [{"rect": [x0, y0, x1, y1], "pages": "all"}, ...],
+    #  "texts": [{"x": 72, "y": 72, "text": "...", "font_size": 12, "pages": "1"}, ...]}
+    # Coordinates are PDF points, pages are selectors for parse_page_selector.
+    if not isinstance(raw, dict):
+        raise ValueError("Edit spec must be a JSON object")
+
+    spec = {"erasures": [], "texts": []}
+    for item in raw.get("erasures", []):
+        x0, y0, x1, y1 = (float(v) for v in item["rect"])
+        spec["erasures"].append(((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)),
+                                 item.get("pages", "all")))
+    for item in raw.get("texts", []):
+        spec["texts"].append(((float(item["x"]), float(item["y"]), str(item["text"]),
+                               float(item.get("font_size", 12))),
+                              item.get("pages", "all")))
+    if not spec["erasures"] and not spec["texts"]:
+        raise ValueError("Edit spec contains no erasures or texts")
+
+    # Fail fast on malformed selectors instead of once per file
+    for _, selector in spec["erasures"] + spec["texts"]:
+        _selector_parts(selector)
+    return spec
+
+
+def group_edit_spec(spec, page_count, page_sizes=None):
+    # page index -> (erasures, texts) of the spec
+    per_page = {}
+    for rect, selector in spec["erasures"]:
+        for i in parse_page_selector(selector, page_count, page_sizes):
+            per_page.setdefault(i, ([], []))[0].append(rect)
+    for text, selector in spec["texts"]:
+        for i in parse_page_selector(selector, page_count, page_sizes):
+            per_page.setdefault(i, ([], []))[1].append(text)
+    return per_page
+
+
+def _spec_selectors(spec):
+    return [selector for _, selector in spec["erasures"] + spec["texts"]]
+
+
+def apply_edit_spec(doc, spec):
+    # Group the spec by page and write each page once
+    per_page = group_edit_spec(spec, doc.page_count, selector_page_sizes(doc, _spec_selectors(spec)))
+    for i in sorted(per_page):
+        erasures, texts = per_page[i]
+        apply_page_edits(doc[i], erasures, texts)
+
+
+def _batch_worker(job):
+    # Runs in a worker process; never raises so one bad file can't stop the batch
+    src, dst, spec = job
+    start = time.perf_counter()
+    try:
+        doc = fitz.open(src)
+        try:
+            apply_edit_spec(doc, spec)
+            doc.save(dst)
+        finally:
+            doc.close()
+        return src, dst, time.perf_counter() - start, None
+    except Exception as e:
+        return src, dst, time.perf_counter() - start, "%s: %s" % (type(e).__name__, e)
+
+
+def export_serial(source, per_page, dst):
+    # Reference path: apply every page's edits in one process and save
+    doc = fitz.open(source)
+    try:
+        for i in sorted(per_page):
+            erasures, texts = per_page[i]
+            apply_page_edits(doc[i], erasures, texts)
+        doc.save(dst)
+    finally:
+        doc.close()
+
+
+def _export_shard(job):
+    # Runs in a worker process with its own copy of the source: copy pages
+    # first..last into a new document, apply their edits and write it out
+    source, first, last, edits, path = job
+    src = fitz.open(source)
+    shard = fitz.open()
+    try:
+        # Links are restored on the assembled document, where all targets exist
+        shard.insert_pdf(src, from_page=first, to_page=last, links=False)
+        for i in sorted(edits):
+            erasures, texts = edits[i]
+            apply_page_edits(shard[i - first], erasures, texts)
+        shard.save(path, garbage=1)
+    finally:
+        shard.close()
+        src.close()
+    return path
+
+
+def export_sharded(source, per_page, dst, workers=None, shard_pages=0):
+    # Apply per_page edits to a large document in page-range shards on a
+    # process pool and assemble the shards with insert_pdf. The outline,
+    # links, metadata and page labels are copied over from the source.
+    # Returns the number of shards.
+    workers = workers or os.cpu_count() or 1
+    src = fitz.open(source)
+    try:
+        page_count = src.page_count
+        if not shard_pages:
+            shard_pages = max(16, math.ceil(page_count / (workers * 4)))
+        folder = tempfile.mkdtemp(prefix=".shards-", dir=os.path.dirname(os.path.abspath(dst)))
+        try:
+            jobs = []
+            for first in range(0, page_count, shard_pages):
+                last = min(first + shard_pages, page_count) - 1
+                edits = {i: per_page[i] for i in range(first, last + 1) if i in per_page}
+                jobs.append((source, first, last, edits, os.path.join(folder, "%06d.pdf" % first)))
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                paths = list(executor.map(_export_shard, jobs))
+
+            out = fitz.open()
+            for path in paths:
+                with fitz.open(path) as shard:
+                    out.insert_pdf(shard, links=False)
+            out.set_metadata(src.metadata)
+            out.set_toc(src.get_toc(simple=False))
+            labels = src.get_page_labels()
+            if labels:
+                out.set_page_labels(labels)
+            for i in range(page_count):
+                for link in src[i].get_links():
+                    out[i].insert_link(link)
+            out.save(dst + ".part", garbage=3)
+            out.close()
+            os.replace(dst + ".part", dst)
+        finally:
+            for name in os.listdir(folder):
+                os.remove(os.path.join(folder, name))
+            os.rmdir(folder)
+            if os.path.exists(dst + ".part"):
+                os.remove(dst + ".part")
+    finally:
+        src.close()
+    return len(jobs)
+
+
+def compare_renders(path_a, path_b, scale=1.0):
+    # Indices of the pages that render to different pixels in the two files
+    a, b = fitz.open(path_a), fitz.open(path_b)
+    try:
+        if a.page_count != b.page_count:
+            return list(range(max(a.page_count, b.page_count)))
+        matrix = fitz.Matrix(scale, scale)
+        return [i for i in range(a.page_count)
+                if a[i].get_pixmap(matrix=matrix).samples != b[i].get_pixmap(matrix=matrix).samples]
+    finally:
+        a.close()
+        b.close()
+
+
+def _collect_pdfs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(".pdf"):
+                    paths.append(os.path.join(item, name))
+        else:
+            paths.append(item)
+    return paths
+
+
+def run_batch(args):
+    try:
+        spec = load_edit_spec(args.spec)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print("Invalid edit spec %s: %s" % (args.spec, e), file=sys.stderr)
+        return 2
+
+    sources = _collect_pdfs(args.inputs)
+    if not sources:
+        print("No PDF files found", file=sys.stderr)
+        return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = []
+    for src in sources:
+        stem, ext = os.path.splitext(os.path.basename(src))
+        if args.output_dir:
+            dst = os.path.join(args.output_dir, stem + ext)
+        else:
+            dst = os.path.join(os.path.dirname(src), stem + args.suffix + ext)
+        jobs.append((src, dst, spec))
+
+    workers = args.jobs or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+    results = []
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for src, dst, seconds, error in executor.map(_batch_worker, jobs, chunksize=chunksize):
+            results.append({"input": src, "output": dst, "seconds": round(seconds, 4), "error": error})
+            if error:
+                print("FAIL %s (%.3fs): %s" % (src, seconds, error), file=sys.stderr)
+            elif not args.quiet:
+                print("ok   %s -> %s (%.3fs)" % (src, dst, seconds))
+    elapsed = time.perf_counter() - start
+
+    failed = sum(1 for r in results if r["error"])
+    print("%d files, %d failed, %.2fs total, %.1f files/s" % (
+        len(results), failed, elapsed, len(results) / elapsed if elapsed else 0.0))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"elapsed": elapsed, "workers": workers, "files": results}, f, indent=2)
+    return 1 if failed else 0
+
+
+def run_export(args):
+    try:
+        spec = load_edit_spec(args.spec)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print("Invalid edit spec %s: %s" % (args.spec, e), file=sys.stderr)
+        return 2
+    dst = args.output
+    if not dst:
+        stem, ext = os.path.splitext(args.input)
+        dst = stem + args.suffix + ext
+
+    try:
+        with fitz.open(args.input) as doc:
+            page_count = doc.page_count
+            page_sizes = selector_page_sizes(doc, _spec_selectors(spec))
+    except (OSError, RuntimeError, ValueError) as e:
+        print("Cannot open %s: %s" % (args.input, e), file=sys.stderr)
+        return 2
+    per_page = group_edit_spec(spec, page_count, page_sizes)
+    workers = args.jobs or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    shards = export_sharded(args.input, per_page, dst, workers=workers, shard_pages=args.shard_pages)
+    elapsed = time.perf_counter() - start
+    print("%s -> %s: %d pages, %d edited, %d shard(s) on %d worker(s), %.2fs" % (
+        args.input, dst, page_count, len(per_page), shards, workers, elapsed))
+
+    if args.verify:
+        # Compare against the serial path, rendered page by page
+        stem, ext = os.path.splitext(dst)
+        reference = stem + "_serial" + ext
+        start = time.perf_counter()
+        export_serial(args.input, per_page, reference)
+        serial = time.perf_counter() - start
+        try:
+            mismatched = compare_renders(dst, reference)
+        finally:
+            os.remove(reference)
+        print("serial export %.2fs (%.1fx speedup)" % (serial, serial / elapsed if elapsed else 0.0))
+        if mismatched:
+            print("FAIL %d page(s) render differently from the serial export: %s" % (
+                len(mismatched), ", ".join(str(i + 1) for i in mismatched[:20])), file=sys.stderr)
+            return 1
+        print("ok   all %d pages render identically to the serial export" % page_count)
+    return 0
+
+
+class DocumentPool:
+    # LRU pool of the documents a serve worker has opened, bounded by count
+    # and bytes. An entry keeps the document as bytes in memory, re-serialized
+    # once if MuPDF had to repair it, so a request for a pooled file skips the
+    # disk read and any repair. Every request edits its own copy opened from
+    # these bytes: MuPDF's undo journal does not roll back the font resources
+    # that inserted text adds, so one shared handle can't be reused safely.
+    # Entries are dropped when the file's size or modification time changes.
+    def __init__(self, max_docs=8, max_bytes=512 * 1024 * 1024):
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> ((size, mtime), document bytes)
+
+    def open(self, path):
+        # (fitz.Document to edit, True if it came from the pool)
+        stat = os.stat(path)
+        identity = (stat.st_size, stat.st_mtime_ns)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == identity:
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return fitz.open("pdf", entry[1]), True
+
+        self.misses += 1
+        if entry is not None:
+            self.current_bytes -= len(self._entries.pop(path)[1])
+        with open(path, "rb") as f:
+            data = f.read()
+        doc = fitz.open("pdf", data)
+        if doc.is_repaired:
+            data = doc.tobytes()
+        if len(data) <= self.max_bytes:
+            self._entries[path] = (identity, data)
+            self.current_bytes += len(data)
+            while len(self._entries) > self.max_docs or self.current_bytes > self.max_bytes:
+                _, (_, old) = self._entries.popitem(last=False)
+                self.current_bytes -= len(old)
+        return doc, False
+
+
+_document_pool = None  # DocumentPool of a serve worker process
+
+
+def _serve_worker_init(max_docs, max_bytes):
+    global _document_pool
+    _document_pool = DocumentPool(max_docs, max_bytes)
+
+
+def _serve_worker(job):
+    # Runs in a serve worker process; never raises, errors are part of the reply.
+    # Edits go through apply_page_edits, the same code the window writes its
+    # applied selections and text with.
+    src, dst, spec = job
+    start = time.perf_counter()
+    result = {"pooled": False, "pool_hits": _document_pool.hits, "pool_misses": _document_pool.misses}
+    try:
+        doc, result["pooled"] = _document_pool.open(src)
+        try:
+            per_page = group_edit_spec(spec, doc.page_count, selector_page_sizes(doc, _spec_selectors(spec)))
+            for i in sorted(per_page):
+                erasures, texts = per_page[i]
+                apply_page_edits(doc[i], erasures, texts)
+            # Written next to the target and renamed, so readers never see a partial file
+            part = dst + ".part"
+            doc.save(part)
+            os.replace(part, dst)
+            result["pages"] = doc.page_count
+            result["edited_pages"] = len(per_page)
+        finally:
+            doc.close()
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["pool_hits"] = _document_pool.hits - result["pool_hits"]
+    result["pool_misses"] = _document_pool.misses - result["pool_misses"]
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+class WhiteoutService:
+    # Applies edit specs to PDFs on a set of single-process worker pools. A
+    # request goes to the worker picked by a hash of its input path, so the
+    # requests for one file always find it in the same worker's DocumentPool.
+    # Replies are delivered through the future of submit(); stats() reports
+    # throughput, latency and queue depth. A worker that dies (MuPDF can
+    # crash on a malformed file) is replaced by a fresh one.
+    def __init__(self, workers=None, pool_size=8, pool_bytes=512 * 1024 * 1024):
+        self._context = multiprocessing.get_context("spawn")
+        self._pool_args = (pool_size, pool_bytes)
+        self.executors = [self._new_executor() for _ in range(workers or os.cpu_count() or 1)]
+        self.queued = [0] * len(self.executors)  # Requests submitted to each worker and not yet finished
+        self.max_queued = 0
+        self.received = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self._recent = deque()  # Completion times of the last minute
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def submit(self, request):
+        # Validate a request {"input": ..., "output": ..., "erasures": [...], "texts": [...]}
+        # and queue it; raises ValueError, KeyError or TypeError for a bad one
+        src = os.path.abspath(str(request["input"]))
+        dst = os.path.abspath(str(request["output"]))
+        if src == dst:
+            raise ValueError("output must not be the input file")
+        spec = parse_edit_spec(request)
+        worker = zlib.crc32(src.encode("utf-8")) % len(self.executors)
+        executor = self.executors[worker]
+        try:
+            future = executor.submit(_serve_worker, (src, dst, spec))
+        except concurrent.futures.process.BrokenProcessPool:
+            # The worker died while idle and this request never reached it:
+            # replace the worker and queue the request there
+            self._restart(worker, executor)
+            executor = self.executors[worker]
+            future = executor.submit(_serve_worker, (src, dst, spec))
+        with self._lock:
+            self.received += 1
+            self.queued[worker] += 1
+            self.max_queued = max(self.max_queued, sum(self.queued))
+        future.add_done_callback(lambda f: self._finished(worker, executor, f))
+        return future
+
+    def _new_executor(self):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=self._context,
+                                                      initializer=_serve_worker_init, initargs=self._pool_args)
+
+    def _restart(self, worker, executor):
+        # Replace a broken worker pool, once, however many requests noticed it
+        with self._lock:
+            if self.executors[worker] is not executor:
+                return
+            self.executors[worker] = self._new_executor()
+            self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, worker, executor, future):
+        error = None if future.cancelled() else future.exception()
+        if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+            self._restart(worker, executor)
+        result = None if future.cancelled() or error else future.result()
+        now = time.monotonic()
+        with self._lock:
+            self.queued[worker] -= 1
+            if result is None or "error" in result:
+                self.failed += 1
+            else:
+                self.completed += 1
+            if result is not None:
+                self.busy_seconds += result["seconds"]
+                self.pool_hits += result["pool_hits"]
+                self.pool_misses += result["pool_misses"]
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+
+    def stats(self):
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            finished = self.completed + self.failed
+            return {
+                "uptime": round(uptime, 3), "workers": len(self.executors),
+                "received": self.received, "completed": self.completed, "failed": self.failed,
+                "worker_restarts": self.restarts,
+                "queue_depth": sum(self.queued), "queue_depth_per_worker": list(self.queued),
+                "max_queue_depth": self.max_queued,
+                "requests_per_s": round(finished / uptime, 3) if uptime else 0.0,
+                "requests_per_s_last_minute": round(len(self._recent) / min(60.0, uptime), 3) if uptime else 0.0,
+                "mean_seconds": round(self.busy_seconds / finished, 4) if finished else 0.0,
+                "pool_hits": self.pool_hits, "pool_misses": self.pool_misses,
+            }
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ServeHandler(socketserver.StreamRequestHandler):
+    # One connection: a JSON request per line, a JSON reply per line. Requests
+    # on one connection run concurrently, so replies can come back out of
+    # order; each echoes the request's "id". {"op": "stats"} returns the
+    # service counters instead of editing a file.
+    def handle(self):
+        self._write_lock = threading.Lock()
+        self._outstanding = 0  # Requests whose reply has not been written yet
+        self._all_replied = threading.Condition()
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request_id = None
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+                request_id = request.get("id")
+                op = request.get("op", "apply")
+                if op == "stats":
+                    self._reply({"id": request_id, "ok": True, "stats": self.server.service.stats()})
+                elif op == "apply":
+                    future = self.server.service.submit(request)
+                    with self._all_replied:
+                        self._outstanding += 1
+                    future.add_done_callback(functools.partial(self._on_done, request_id, request))
+                else:
+                    raise ValueError("unknown op %r" % op)
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply({"id": request_id, "ok": False, "error": "Invalid request: %s" % e})
+            except Exception as e:
+                # E.g. BrokenProcessPool: the worker has been replaced, the request can be retried
+                self._reply({"id": request_id, "ok": False, "error": "%s: %s" % (type(e).__name__, e)})
+        # The client closed its side; finish what it asked for before closing ours
+        with self._all_replied:
+            self._all_replied.wait_for(lambda: self._outstanding == 0)
+
+    def _on_done(self, request_id, request, future):
+        if future.cancelled():
+            reply = {"id": request_id, "ok": False, "error": "Cancelled"}
+        elif future.exception():
+            reply = {"id": request_id, "ok": False, "error": "%s: %s" % (
+                type(future.exception()).__name__, future.exception())}
+        else:
+            result = future.result()
+            reply = {"id": request_id, "ok": "error" not in result, "output": request["output"]}
+            reply.update(result)
+            reply["seconds"] = round(result["seconds"], 4)
+        if not self.server.quiet or not reply["ok"]:
+            print("%s %s (%.3fs)%s" % ("ok  " if reply["ok"] else "FAIL", request.get("input"),
+                                       reply.get("seconds", 0.0), "" if reply["ok"] else ": " + reply["error"]),
+                  file=sys.stdout if reply["ok"] else sys.stderr)
+        self._reply(reply)
+        with self._all_replied:
+            self._outstanding -= 1
+            self._all_replied.notify_all()
+
+    def _reply(self, reply):
+        data = (json.dumps(reply) + "\n").encode("utf-8")
+        with self._write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                pass  # The client went away; the edit itself is done
+
+
+class ServeTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class ServeUnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def run_serve(args):
+    if args.unix:
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            print("Unix sockets are not available on this platform", file=sys.stderr)
+            return 2
+        if os.path.exists(args.unix):
+            os.remove(args.unix)  # Left behind by a server that did not shut down cleanly
+        server = ServeUnixServer(args.unix, ServeHandler)
+        address = args.unix
+    else:
+        host, _, port = args.listen.rpartition(":")
+        server = ServeTCPServer((host or "127.0.0.1", int(port)), ServeHandler)
+        address = "%s:%d" % server.server_address[:2]
+    server.quiet = args.quiet
+    server.service = WhiteoutService(args.jobs, pool_size=args.pool_size, pool_bytes=args.pool_mb * 1024 * 1024)
+    print("Serving on %s with %d worker(s), Ctrl + C to stop" % (address, len(server.service.executors)))
+    # Stop the same way on SIGTERM, as sent by service managers; shutdown() must not run on the serving thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+    stats = server.service.stats()
+    print("%d request(s), %d failed, %.1f requests/s, %.3fs mean, pool %d hit(s) / %d miss(es)" % (
+        stats["received"], stats["failed"], stats["requests_per_s"], stats["mean_seconds"],
+        stats["pool_hits"], stats["pool_misses"]))
+    return 0
+
+
+def run_gui(args):
     root = tk.Tk()
     app = PDFEditorApp(root)
+    root.after_idle(_preload_modules)
+    app.load_in_memory = args.in_memory
+    app.store_limit = args.store_limit * 1024 * 1024
+    if args.profile:
+        enable_profiling()
+        app.profile_path = args.profile
+    if args.perf_overlay:
+        app.toggle_perf_overlay()
+    if args.open:
+        root.after_idle(app.load_pdf, args.open)
     root.mainloop()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF whiteout and text annotation tool")
+    parser.add_argument("--open", metavar="PDF", help="PDF to open when the window starts")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Open documents from a memory map of the file instead of by name")
+    parser.add_argument("--store-limit", type=int, default=128, metavar="MB",
+                        help="Cap on MuPDF's resource cache (default: 128, 0 for MuPDF's own limit)")
+    parser.add_argument("--profile", metavar="TRACE", help="Record the editor's hot paths and write them as "
+                        "Chrome trace JSON (chrome://tracing, Perfetto) to this file on exit")
+    parser.add_argument("--perf-overlay", action="store_true",
+                        help="Show frame time and cache counters on the canvas (toggle with F12)")
+    parser.set_defaults(func=run_gui)
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch = subparsers.add_parser("batch", help="Apply an edit spec to many PDFs without the GUI")
+    batch.add_argument("spec", help="JSON edit spec with erasures/texts in PDF points")
+    batch.add_argument("inputs", nargs="+", help="PDF files and/or directories containing PDFs")
+    batch.add_argument("-o", "--output-dir", help="Directory for the edited files (default: next to the input)")
+    batch.add_argument("--suffix", default="_whiteout", help="Output name suffix when no --output-dir is given")
+    batch.add_argument("-j", "--jobs", type=int, default=0, help="Worker processes (default: CPU count)")
+    batch.add_argument("--report", help="Write per-file timings and failures as JSON to this path")
+    batch.add_argument("-q", "--quiet", action="store_true", help="Only print failures and the summary")
+    batch.set_defaults(func=run_batch)
+
+    export = subparsers.add_parser("export", help="Apply an edit spec to one large PDF in parallel page-range shards")
+    export.add_argument("spec", help="JSON edit spec with erasures/texts in PDF points")
+    export.add_argument("input", help="PDF file to edit")
+    export.add_argument("-o", "--output", help="Output file (default: next to the input)")
+    export.add_argument("--suffix", default="_whiteout", help="Output name suffix when no --output is given")
+    export.add_argument("-j", "--jobs", type=int, default=0, help="Worker processes (default: CPU count)")
+    export.add_argument("--shard-pages", type=int, default=0, help="Pages per shard (default: about 4 shards per worker)")
+    export.add_argument("--verify", action="store_true",
+                        help="Also export serially and check that every page renders identically")
+    export.set_defaults(func=run_export)
+
+    serve = subparsers.add_parser("serve", help="Apply edit specs sent as JSON lines over a local socket")
+    serve.add_argument("--listen", default="127.0.0.1:8765", metavar="[HOST:]PORT",
+                       help="TCP address to listen on (default: 127.0.0.1:8765)")
+    serve.add_argument("--unix", metavar="PATH", help="Listen on this Unix socket instead of TCP")
+    serve.add_argument("-j", "--jobs", type=int, default=0, help="Worker processes (default: CPU count)")
+    serve.add_argument("--pool-size", type=int, default=8, help="Documents kept open per worker (default: 8)")
+    serve.add_argument("--pool-mb", type=int, default=512, help="Memory for kept documents per worker (default: 512)")
+    serve.add_argument("-q", "--quiet", action="store_true", help="Only print failures")
+    serve.set_defaults(func=run_serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
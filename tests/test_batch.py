@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_whiteout import main, parse_page_selector
+
+A4 = (595.0, 842.0)
+LETTER = (612.0, 792.0)
+
+
+def test_page_selectors():
+    assert parse_page_selector("all", 4) == [0, 1, 2, 3]
+    assert parse_page_selector(None, 2) == [0, 1]
+    assert parse_page_selector("last", 7) == [6]
+    assert parse_page_selector("last", 0) == []
+    assert parse_page_selector("all", 0) == []
+    assert parse_page_selector("8-", 10) == [7, 8, 9]
+    assert parse_page_selector("8-", 5) == []
+    assert parse_page_selector("3-10", 5) == [2, 3, 4]
+    assert parse_page_selector("1, 3, 2-3, last", 6) == [0, 1, 2, 5]
+    sizes = [LETTER, A4, LETTER, (842.5, 595.0), (595.4, 841.6)]
+    assert parse_page_selector("size:a4", len(sizes), sizes) == [1, 4]
+    assert parse_page_selector("size:612x792", len(sizes), sizes) == [0, 2]
+    assert parse_page_selector("size:a4,1", len(sizes), sizes) == [0, 1, 4]
+
+
+@pytest.mark.parametrize("selector", ["0", "3-1", "1-2-3", "x", "0-4", "size:nope"])
+def test_page_selector_rejects(selector):
+    with pytest.raises(ValueError):
+        parse_page_selector(selector, 10, [A4] * 10)
+
+
+def test_size_selector_needs_sizes():
+    with pytest.raises(ValueError):
+        parse_page_selector("size:a4", 3)
+
+
+def test_batch_reports_unreadable_files(tmp_path, capsys):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for name in ("one.pdf", "two.pdf"):
+        doc = fitz.open()
+        for _ in range(3):
+            doc.new_page().insert_text((72, 72), "Account 12345", fontsize=12)
+        doc.save(str(inputs / name))
+        doc.close()
+    (inputs / "broken.pdf").write_bytes(b"not a pdf at all")
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps({"erasures": [{"rect": [60, 50, 300, 80], "pages": "1,last"}],
+                                "texts": [{"x": 72, "y": 72, "text": "REDACTED", "pages": "2"}]}))
+    report = tmp_path / "report.json"
+    out = tmp_path / "out"
+
+    assert main(["batch", str(spec), str(inputs), "-o", str(out), "-j", "2", "--report", str(report), "-q"]) == 1
+    assert "FAIL" in capsys.readouterr().err
+
+    files = {os.path.basename(entry["input"]): entry for entry in json.loads(report.read_text())["files"]}
+    assert sorted(files) == ["broken.pdf", "one.pdf", "two.pdf"]
+    assert files["broken.pdf"]["error"]
+    assert files["one.pdf"]["error"] is None and files["two.pdf"]["error"] is None
+    with fitz.open(files["one.pdf"]["output"]) as doc:
+        # Whiteouts are painted over, the text underneath stays
+        assert [len([d for d in page.get_drawings() if d.get("fill") == (1.0, 1.0, 1.0)]) for page in doc] == [1, 0, 1]
+        assert "REDACTED" in doc[1].get_text()
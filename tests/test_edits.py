@@ -0,0 +1,67 @@
+import os
+import random
+import re
+import sys
+
+import fitz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_whiteout import apply_page_edits, merge_rects
+
+
+def _raster(rects, size=100):
+    # Unit cells of a size x size grid whose centre lies in one of the rectangles
+    return {(x, y) for x0, y0, x1, y1 in rects
+            for x in range(max(0, int(x0)), min(size, int(x1) + 1))
+            for y in range(max(0, int(y0)), min(size, int(y1) + 1))
+            if x0 <= x + 0.5 < x1 and y0 <= y + 0.5 < y1}
+
+
+def test_merge_rects_paints_the_same_pixels():
+    rng = random.Random(8)
+    for _ in range(300):
+        rects = []
+        for _ in range(rng.randrange(1, 30)):
+            x0, y0 = rng.randrange(0, 60), rng.randrange(0, 60)
+            rects.append((x0, y0, x0 + rng.randrange(1, 20), y0 + rng.randrange(1, 20)))
+        # Rows and columns of neighbours, which are what merging joins
+        x0, y0 = rng.randrange(0, 30), rng.randrange(0, 30)
+        rects += [(x0 + 4 * i, y0, x0 + 4 * i + 4, y0 + 6) for i in range(rng.randrange(5))]
+        rects += [(x0, y0 + 3 * i, x0 + 5, y0 + 3 * i + 3) for i in range(rng.randrange(5))]
+        merged = merge_rects(rects)
+        assert len(merged) <= len(set(rects))
+        assert _raster(merged) == _raster(rects)
+
+
+def test_merge_rects_touching_contained_and_duplicates():
+    # Touching along a row and along a column
+    assert merge_rects([(0, 0, 10, 5), (10, 0, 20, 5)]) == [(0, 0, 20, 5)]
+    assert merge_rects([(0, 0, 10, 5), (0, 5, 10, 12)]) == [(0, 0, 10, 12)]
+    # Touching but with different spans: the union is not a rectangle
+    assert sorted(merge_rects([(0, 0, 10, 5), (10, 0, 20, 6)])) == [(0, 0, 10, 5), (10, 0, 20, 6)]
+    # Contained, including an exact copy
+    assert merge_rects([(2, 2, 4, 4), (0, 0, 10, 10), (0, 0, 10, 10)]) == [(0, 0, 10, 10)]
+    assert merge_rects([(1, 1, 3, 3)] * 5) == [(1, 1, 3, 3)]
+    # Empty rectangles are dropped
+    assert merge_rects([(5, 5, 5, 9), (3, 3, 1, 1)]) == []
+
+
+def test_apply_page_edits_writes_one_fragment_with_base14_text():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Existing text", fontname="tiro")
+    contents = page.get_contents()
+    fonts = set(page.get_fonts())
+
+    stats = apply_page_edits(page, [(60, 50, 300, 80), (300, 50, 400, 80), (100, 200, 150, 250)],
+                             [(72, 300, "REDACTED", 12.0), (72, 340, "two\nlines", 10.0)])
+    assert stats["rects"] == 3 and stats["fills"] == 2 and stats["texts"] == 2
+
+    added = page.get_contents()[len(contents):]
+    assert page.get_contents()[:len(contents)] == contents and len(added) == 1
+    # The new fragment only selects helv, a base-14 font that is not embedded
+    assert set(re.findall(rb"/(\S+) [\d.]+ Tf", doc.xref_stream(added[0]))) == {b"helv"}
+    new_fonts = set(page.get_fonts()) - fonts
+    assert [(ext, basefont, name) for _, ext, _, basefont, name, _ in new_fonts] == [("n/a", "Helvetica", "helv")]
+    assert all(doc.xref_get_key(xref, "FontDescriptor") == ("null", "null") for xref, *_ in new_fonts)
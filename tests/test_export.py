@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_whiteout import compare_renders, export_serial, export_sharded, main
+
+PAGES = 24
+
+
+@pytest.fixture
+def linked_pdf(tmp_path):
+    # Pages with text, links to other pages (across shard boundaries) and
+    # the web, an outline with nested entries and page labels
+    path = str(tmp_path / "linked.pdf")
+    doc = fitz.open()
+    for i in range(PAGES):
+        page = doc.new_page()
+        page.insert_text((72, 72), "Page %d Account 12345 John Smith" % (i + 1), fontsize=14)
+        page.insert_text((72, 120), "See page %d" % ((i + 7) % PAGES + 1), fontsize=11)
+        page.draw_rect(fitz.Rect(100, 200, 300, 400), color=(0, 0, 1), fill=(0.5, 0.5, 1))
+    for i in range(PAGES):
+        doc[i].insert_link({"kind": fitz.LINK_GOTO, "from": fitz.Rect(72, 108, 200, 124),
+                            "page": (i + 7) % PAGES, "to": fitz.Point(72, 72)})
+        doc[i].insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(72, 500, 200, 520),
+                            "uri": "https://example.com/%d" % i})
+    doc.set_toc([[1, "Part one", 1], [2, "Section", 3], [1, "Part two", 13], [2, "Section", 20]])
+    doc.set_page_labels([{"startpage": 0, "prefix": "A-", "style": "D", "firstpagenum": 1}])
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _edits():
+    return {
+        0: ([(60, 50, 300, 80)], [(72, 300, "REDACTED", 12.0)]),
+        7: ([(60, 50, 300, 80), (100, 200, 200, 300)], []),
+        8: ([], [(72, 300, "REDACTED\nline two", 10.0)]),
+        PAGES - 1: ([(0, 0, 50, 50)], [(300, 700, "last", 14.0)]),
+    }
+
+
+def test_sharded_export_matches_serial(linked_pdf, tmp_path):
+    sharded = str(tmp_path / "sharded.pdf")
+    serial = str(tmp_path / "serial.pdf")
+    assert export_sharded(linked_pdf, _edits(), sharded, workers=2, shard_pages=5) == 5
+    export_serial(linked_pdf, _edits(), serial)
+
+    assert compare_renders(sharded, serial) == []
+    with fitz.open(linked_pdf) as src, fitz.open(sharded) as out:
+        assert out.get_toc() == src.get_toc()
+        assert out.get_page_labels() == src.get_page_labels()
+        for i in range(PAGES):
+            assert ([(link["kind"], link.get("page"), link.get("uri")) for link in out[i].get_links()]
+                    == [(link["kind"], link.get("page"), link.get("uri")) for link in src[i].get_links()])
+
+
+def test_export_bad_input(tmp_path, capsys):
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps({"erasures": [{"rect": [60, 50, 300, 80], "pages": "all"}]}))
+    unreadable = tmp_path / "broken.pdf"
+    unreadable.write_bytes(b"not a pdf at all")
+
+    assert main(["export", str(spec), str(tmp_path / "missing.pdf")]) == 2
+    assert main(["export", str(spec), str(unreadable)]) == 2
+    assert "Cannot open" in capsys.readouterr().err
@@ -0,0 +1,119 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_whiteout import EditJournal
+
+
+def _apply(journal, page_index, rects=(), texts=()):
+    # Record an apply of rects and (x, y, text, font_size) texts; returns the text keys
+    keyed = tuple((journal.new_key(),) + tuple(text) for text in texts)
+    journal.record(page_index, ("apply", tuple(rects), keyed))
+    return [row[0] for row in keyed]
+
+
+def test_undo_redo_pointers():
+    journal = EditJournal()
+    assert not journal.can_undo(0) and not journal.can_redo(0)
+    assert not journal.undo(0) and not journal.redo(0)
+    _apply(journal, 0, [(0, 0, 10, 10)])
+    _apply(journal, 0, [(20, 20, 30, 30)])
+    _apply(journal, 3, [(1, 1, 2, 2)])
+    assert journal.pages() == [0, 3]
+
+    version = journal.version
+    assert journal.undo(0) and journal.version == version + 1
+    assert journal.state(0)[0] == [(0, 0, 10, 10)]
+    assert journal.can_undo(0) and journal.can_redo(0)
+    assert journal.undo(0) and not journal.undo(0)
+    assert journal.state(0) == ([], {}) and journal.pages() == [3]
+    # Other pages keep their own pointer
+    assert journal.state(3)[0] == [(1, 1, 2, 2)] and not journal.can_redo(3)
+    assert journal.redo(0) and journal.redo(0) and not journal.redo(0)
+    assert journal.state(0)[0] == [(0, 0, 10, 10), (20, 20, 30, 30)]
+
+
+def test_recording_drops_the_redo_tail():
+    journal = EditJournal()
+    _apply(journal, 0, [(0, 0, 10, 10)])
+    _apply(journal, 0, [(20, 20, 30, 30)])
+    _apply(journal, 0, [(40, 40, 50, 50)])
+    journal.undo(0)
+    journal.undo(0)
+    _apply(journal, 0, [(60, 60, 70, 70)])
+    assert not journal.can_redo(0)
+    assert journal.state(0)[0] == [(0, 0, 10, 10), (60, 60, 70, 70)]
+    journal.undo(0)
+    assert journal.redo(0)
+    assert journal.state(0)[0] == [(0, 0, 10, 10), (60, 60, 70, 70)]
+
+
+def test_replay_of_move_resize_and_remove():
+    journal = EditJournal()
+    first, second = _apply(journal, 2, [(0, 0, 5, 5)], [(10, 20, "one", 12.0), (30, 40, "two", 9.0)])
+    journal.record(2, ("move", first, 100, 200))
+    journal.record(2, ("resize", first, 18.0))
+    journal.record(2, ("remove", second))
+    # Operations on a key that no longer exists are ignored
+    journal.record(2, ("move", second, 1, 1))
+    rects, texts = journal.state(2)
+    assert rects == [(0, 0, 5, 5)]
+    assert texts == {first: (100, 200, "one", 18.0)}
+
+    journal.undo(2)
+    journal.undo(2)
+    assert journal.state(2)[1] == {first: (100, 200, "one", 18.0), second: (30, 40, "two", 9.0)}
+    journal.undo(2)
+    assert journal.state(2)[1][first] == (100, 200, "one", 12.0)
+    journal.undo(2)
+    assert journal.state(2)[1][first] == (10, 20, "one", 12.0)
+
+
+def test_state_memo_is_invalidated():
+    journal = EditJournal()
+    key, = _apply(journal, 0, [], [(10, 20, "one", 12.0)])
+    texts = journal.state(0)[1]
+    assert journal.state(0)[1] is texts
+    journal.record(0, ("move", key, 50, 60))
+    moved = journal.state(0)[1]
+    assert moved is not texts and moved[key] == (50, 60, "one", 12.0)
+    journal.undo(0)
+    assert journal.state(0)[1][key] == (10, 20, "one", 12.0)
+    journal.redo(0)
+    assert journal.state(0)[1][key] == (50, 60, "one", 12.0)
+    journal.clear()
+    assert journal.state(0) == ([], {}) and journal.pages() == []
+
+
+def test_edits_lists_pages_with_active_edits():
+    journal = EditJournal()
+    _apply(journal, 0, [(0, 0, 10, 10)], [(10, 20, "one", 12.0)])
+    key, = _apply(journal, 1, [], [(5, 5, "gone", 8.0)])
+    journal.record(1, ("remove", key))
+    _apply(journal, 4, [(1, 1, 2, 2)])
+    journal.undo(4)
+    edits = journal.edits()
+    # Page 1 only removes its own text and page 4 is undone
+    assert edits == {0: ([(0, 0, 10, 10)], [(10, 20, "one", 12.0)])}
+    # Copies: changing them leaves the journal alone
+    edits[0][0].append((5, 5, 6, 6))
+    assert journal.state(0)[0] == [(0, 0, 10, 10)]
+
+
+def test_hold_and_release():
+    journal = EditJournal()
+    _apply(journal, 0, [(0, 0, 10, 10)])
+    held = journal.hold()
+    assert held == {0: 1} and not journal.can_undo(0)
+    _apply(journal, 0, [(20, 20, 30, 30)])
+    assert journal.undo(0) and not journal.undo(0)
+    journal.redo(0)
+    journal.release(held, written=True)
+    # The held operation is now in the file; the later one stays undoable
+    assert journal.state(0)[0] == [(20, 20, 30, 30)]
+    assert journal.undo(0) and not journal.can_undo(0)
+
+    held = journal.hold()
+    journal.release(held, written=False)
+    assert journal.redo(0) and journal.undo(0)
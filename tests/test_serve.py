@@ -0,0 +1,114 @@
+import os
+import signal
+import sys
+import time
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_whiteout import DocumentPool, WhiteoutService
+
+
+def _write_pdf(path, pages=2, text="Account 12345"):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page().insert_text((72, 72), text, fontsize=12)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _open(pool, path):
+    doc, pooled = pool.open(path)
+    doc.close()
+    return pooled
+
+
+def test_pool_drops_changed_files(tmp_path):
+    pool = DocumentPool()
+    path = _write_pdf(tmp_path / "a.pdf")
+    assert not _open(pool, path)
+    assert _open(pool, path)
+    # A different size
+    _write_pdf(path, pages=3)
+    assert not _open(pool, path)
+    assert _open(pool, path)
+    # The same size, a different modification time
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5 * 10 ** 9))
+    assert not _open(pool, path)
+    assert (pool.hits, pool.misses) == (2, 3)
+    assert pool.current_bytes == os.path.getsize(path)
+
+
+def test_pool_eviction(tmp_path):
+    paths = [_write_pdf(tmp_path / ("%d.pdf" % i)) for i in range(3)]
+    sizes = [os.path.getsize(path) for path in paths]
+
+    pool = DocumentPool(max_docs=2)
+    for path in paths:
+        _open(pool, path)
+    assert _open(pool, paths[2]) and _open(pool, paths[1])
+    assert not _open(pool, paths[0])  # The least recently used one went first
+
+    pool = DocumentPool(max_bytes=sum(sizes) - 1)
+    _open(pool, paths[0])
+    _open(pool, paths[1])
+    assert pool.current_bytes == sizes[0] + sizes[1]
+    _open(pool, paths[2])
+    assert pool.current_bytes == sizes[1] + sizes[2]
+    assert not _open(pool, paths[0])
+
+    # Files larger than the whole budget are never pooled
+    pool = DocumentPool(max_bytes=sizes[0] - 1)
+    _open(pool, paths[0])
+    assert pool.current_bytes == 0 and not _open(pool, paths[0])
+
+
+def _queue_drained(service, timeout=10):
+    # Completion is counted in a done-callback, which may run just after result() returns
+    deadline = time.monotonic() + timeout
+    while service.stats()["queue_depth"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return service.stats()
+
+
+@pytest.fixture
+def service():
+    service = WhiteoutService(workers=1)
+    yield service
+    service.shutdown()
+
+
+def _request(tmp_path, src, name):
+    return {"input": src, "output": str(tmp_path / name), "erasures": [{"rect": [60, 50, 300, 80]}]}
+
+
+def test_service_reopens_rewritten_input(service, tmp_path):
+    src = _write_pdf(tmp_path / "in.pdf")
+    assert service.submit(_request(tmp_path, src, "1.pdf")).result(60)["pooled"] is False
+    assert service.submit(_request(tmp_path, src, "2.pdf")).result(60)["pooled"] is True
+    _write_pdf(src, pages=4)
+    reply = service.submit(_request(tmp_path, src, "3.pdf")).result(60)
+    assert reply["pooled"] is False and reply["pages"] == 4
+    stats = _queue_drained(service)
+    assert (stats["pool_hits"], stats["pool_misses"]) == (1, 2)
+
+
+def test_service_replaces_a_killed_worker(service, tmp_path):
+    src = _write_pdf(tmp_path / "in.pdf")
+    assert "error" not in service.submit(_request(tmp_path, src, "1.pdf")).result(60)
+    executor = service.executors[0]
+    for pid in list(executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    deadline = time.monotonic() + 10
+    while not executor._broken and time.monotonic() < deadline:
+        time.sleep(0.01)  # Let the pool notice while it is idle
+
+    reply = service.submit(_request(tmp_path, src, "2.pdf")).result(60)
+    assert "error" not in reply and reply["pooled"] is False
+    stats = _queue_drained(service)
+    assert stats["worker_restarts"] == 1
+    assert stats["queue_depth"] == 0 and stats["completed"] == 2 and stats["failed"] == 0
@@ -0,0 +1,50 @@
+import math
+import os
+import random
+import sys
+
+import fitz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_whiteout import TILE_SIZE, render_tiles, tile_clip
+
+
+def _scanned_page():
+    # A letter page that is one noisy full-page image, like a scan
+    rng = random.Random(1)
+    image = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 850, 1100), False)
+    image.set_rect(image.irect, (200,))
+    for _ in range(3000):
+        x, y = rng.randrange(840), rng.randrange(1090)
+        image.set_rect(fitz.IRect(x, y, x + 8, y + 8), (rng.randrange(256),))
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=image.tobytes("png"))
+    return doc, page
+
+
+def test_tiles_match_full_render_on_scans():
+    doc, page = _scanned_page()
+    for scale in (3.0, 5.0):
+        matrix = fitz.Matrix(scale, scale)
+        full = page.get_pixmap(matrix=matrix)
+        tiles = [(col, row) for col in range(3) for row in range(2)]
+        pixmaps = render_tiles(page, scale, tiles)
+        assert sorted(pixmaps) == tiles
+        for (col, row), pix in pixmaps.items():
+            # Same place and size as a tile rendered on its own, same pixels as the full page
+            assert pix.irect == page.get_pixmap(matrix=matrix, clip=tile_clip(page.rect, scale, col, row)).irect
+            expected = fitz.Pixmap(full.colorspace, pix.irect, full.alpha)
+            expected.copy(full, pix.irect)
+            assert pix.samples == expected.samples
+
+
+def test_edge_tiles_are_clipped_to_the_page():
+    doc, page = _scanned_page()
+    scale = 2.5
+    width = math.ceil(page.rect.width * scale)
+    last = (width - 1) // TILE_SIZE
+    pix = render_tiles(page, scale, [(last, 0)])[(last, 0)]
+    x0, _, x1, _ = pix.irect
+    assert (x0, x1) == (last * TILE_SIZE, width)